@@ -1,53 +1,69 @@
 
-from numba import jit
 import numpy as np
 
 
-@jit
 def initSocialZones(density, sigmaFront, velocities, maxcost, plotsize=3):
     x = np.arange(-plotsize, plotsize, density)  # [m]
     y = np.arange(-plotsize, plotsize, density)
-    zones = []
-    for vel in velocities:
-        zones.append(makeProxemicZone(
-            0, 0, x, y, 0, sigmaFront+(1*vel), maxcost))  # TODO only apply velocity if its negative
-    return zones
+    velocities = np.asarray(velocities, dtype=float)
+    # TODO only apply velocity if its negative
+    return makeProxemicZones(x, y, np.zeros(len(velocities)), sigmaFront+(1*velocities), maxcost)
 
 
-@jit
-def asymetricGaus(x=0, y=0, x0=0, y0=0, theta=0, sigmaFront=2, sigmaSide=4/3, sigmaBack=1) -> float:
-    angle: float = np.mod(np.arctan2(y-y0, x-x0), 2*np.pi)+theta
-    if (abs(angle) >= np.pi/2 and abs(angle) <= np.pi+np.pi/2):
-        sigma: float = sigmaBack
-    else:
-        sigma: float = sigmaFront
+def asymetricGausGrid(x, y, x0=0, y0=0, theta=0, sigmaFront=2, sigmaSide=4/3, sigmaBack=1) -> np.ndarray:
+    '''
+    Asymmetric Gaussian cost of the points x, y around a person at x0, y0 facing theta, every
+    argument can be an array as long as their shapes broadcast
+    '''
+    dx = x - x0
+    dy = y - y0
+    angle = np.mod(np.arctan2(dy, dx)+theta, 2*np.pi)
+    sigma = np.where((angle >= np.pi/2) & (angle <= np.pi+np.pi/2), sigmaBack, sigmaFront)
 
-    a: float = ((np.cos(theta) ** 2)/(2*sigma ** 2)) + \
-        ((np.sin(theta) ** 2)/(2*sigmaSide ** 2))
-    b: float = (np.sin(2*theta)/(4*sigma ** 2)) - \
-        (np.sin(2*theta)/(4*sigmaSide ** 2))
-    c: float = ((np.sin(theta) ** 2)/(2*sigma ** 2)) + \
-        ((np.cos(theta) ** 2)/(2*sigmaSide ** 2))
+    cos2 = np.cos(theta) ** 2
+    sin2 = np.sin(theta) ** 2
+    sin2theta = np.sin(2*theta)
+    a = (cos2/(2*sigma ** 2)) + (sin2/(2*sigmaSide ** 2))
+    # rows grow downwards, so the front of a zone with theta points to -theta in x, y
+    b = (sin2theta/(4*sigmaSide ** 2)) - (sin2theta/(4*sigma ** 2))
+    c = (sin2/(2*sigma ** 2)) + (cos2/(2*sigmaSide ** 2))
 
-    return np.exp(-(a*(x-x0) ** 2+2*b*(x-x0)*(y-y0)+c*(y-y0) ** 2))
+    return np.exp(-(a*dx ** 2+2*b*dx*dy+c*dy ** 2))
+
+
+# costs at 0.5m, 1.0m and 1.5m to the side of a person, the borders of the cost levels
+INTIMATE_COST = float(asymetricGausGrid(0.0, 0.5))
+PERSONAL_COST = float(asymetricGausGrid(0.0, 1.0))
+SOCIAL_COST = float(asymetricGausGrid(0.0, 1.5))
 
 
-@jit
 def makeProxemicZone(x0, y0, x, y, theta, sigmaFront, maxcost) -> np.ndarray:
-    social: np.ndarray = np.zeros((len(x), len(y)), dtype=np.uint8)
-    for i in range(len(x)):
-        for j in range(len(y)):
-            social[j, i] = thresholdCost(asymetricGaus(
-                x[i], y[j], x0, y0, theta, sigmaFront), maxcost)
-    return social
-
-
-@jit
-def thresholdCost(cost: float, maxcost: float) -> float:
-    if cost > asymetricGaus(y=0.5):
-        return maxcost
-    if cost > asymetricGaus(y=1.0):
-        return np.floor(maxcost*asymetricGaus(y=1.0))
-    if cost > asymetricGaus(y=1.5):
-        return cost*maxcost
-    return 0
+    '''
+    Zone of a person at x0, y0 facing theta on the grid x, y with rows along y and columns along x
+
+    theta is applied in the image convention of the map, a zone with theta is equal to
+    the zone of theta 0 rotated counterclockwise by theta as displayed
+    '''
+    X, Y = np.meshgrid(x, y)
+    return thresholdCost(asymetricGausGrid(X, Y, x0, y0, theta, sigmaFront), maxcost)
+
+
+def makeProxemicZones(x, y, thetas, sigmaFronts, maxcost, sigmaSide=4/3, sigmaBack=1) -> np.ndarray:
+    '''
+    Builds the zones of all pairs of thetas and sigmaFronts in one call
+
+    Return
+    ----------
+    zones: (K, len(y), len(x)) uint8 zones centered on the grid x, y
+    '''
+    X, Y = np.meshgrid(x, y)
+    thetas = np.asarray(thetas, dtype=float).reshape(-1, 1, 1)
+    sigmaFronts = np.asarray(sigmaFronts, dtype=float).reshape(-1, 1, 1)
+    return thresholdCost(asymetricGausGrid(X, Y, 0, 0, thetas, sigmaFronts, sigmaSide, sigmaBack), maxcost)
+
+
+def thresholdCost(cost: np.ndarray, maxcost: float) -> np.ndarray:
+    social = np.where(cost > SOCIAL_COST, cost*maxcost, 0)
+    social = np.where(cost > PERSONAL_COST, np.floor(maxcost*PERSONAL_COST), social)
+    social = np.where(cost > INTIMATE_COST, maxcost, social)
+    return social.astype(np.uint8)
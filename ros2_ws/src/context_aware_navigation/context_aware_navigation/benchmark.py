@@ -0,0 +1,331 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+# largest angle between the heading of a person and the direction of its kernel, the heading bins are 2 degrees
+ORIENTATION_TOLERANCE = np.deg2rad(2)
+
+STARTUP_SNIPPET = '''
+import json, time
+start = time.perf_counter()
+import numpy as np
+from context_aware_navigation.social_zones import SocialCanvas, cachedKernelBank, peopleFootprints
+imported = time.perf_counter()
+bank = cachedKernelBank({density}, {maxcost}, {plotsize})
+built = time.perf_counter()
+# like the start of the node, compiles stampRect or loads it from the numba cache
+side = round({size}/{density})
+canvas = SocialCanvas((side, side), bank, dtype=np.uint8)
+canvas.warm()
+warmed = time.perf_counter()
+# first map of a small crowd, half of it walking
+rng = np.random.default_rng(0)
+people = np.zeros(({people}, 6))
+people[:, :2] = rng.uniform(-5, 5, ({people}, 2))
+people[:, 2] = rng.uniform(-np.pi, np.pi, {people})
+people[::2, 3:5] = rng.normal(0, 0.8, (len(people[::2]), 2))
+canvas.moveTo(-side//2, -side//2)
+canvas.update(peopleFootprints(people, bank, {density})[0])
+print(json.dumps({{"import": imported - start, "bank": built - imported, "warm": warmed - built,
+                  "update": time.perf_counter() - warmed}}))
+'''
+
+
+def startupTime(cacheDir: str, numbaCacheDir: str, density: float = 0.05, maxcost: float = 253,
+                plotsize: float = 4, people: int = 5, size: float = 15) -> dict:
+    '''
+    Seconds a fresh interpreter needs to import the kernels, get the kernel bank and warm up the
+    stamping like the social map node and compose the first map of a crowd of people in a
+    size x size [m] window
+    '''
+    env = dict(os.environ, SOCIAL_ZONES_CACHE_DIR=cacheDir, NUMBA_CACHE_DIR=numbaCacheDir)
+    snippet = STARTUP_SNIPPET.format(density=density, maxcost=maxcost, plotsize=plotsize, people=people, size=size)
+    output = subprocess.run([sys.executable, '-c', snippet], env=env, check=True, capture_output=True,
+                            text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def benchmarkStartup(runs: int = 3, density: float = 0.05, people: int = 5):
+    '''
+    Compares the startup of the kernels up to the first map without any cache against a start with
+    the numba and kernel caches filled
+    '''
+    cold, warm = [], []
+    for run in range(runs):
+        with tempfile.TemporaryDirectory() as cacheDir, tempfile.TemporaryDirectory() as numbaCacheDir:
+            cold.append(startupTime(cacheDir, numbaCacheDir, density, people=people))
+            warm.append(startupTime(cacheDir, numbaCacheDir, density, people=people))
+    for name, times in (('cold', cold), ('cached', warm)):
+        steps = {step: np.array([t[step] for t in times]) for step in ('import', 'bank', 'warm', 'update')}
+        print(f"{name:>6}: import {1e3 * np.median(steps['import']):7.1f}ms  "
+              f"kernel bank {1e3 * np.median(steps['bank']):7.1f}ms  "
+              f"stamping warm up {1e3 * np.median(steps['warm']):7.1f}ms  "
+              f"first map of {people} people {1e3 * np.median(steps['update']):6.1f}ms  "
+              f"total {1e3 * np.median(sum(steps.values())):7.1f}ms (median of {runs})")
+
+
+def benchmarkStamping(crowds=(1, 3, 10, 50, 100, 300), density: float = 0.05, size: float = 15, repeats: int = 20):
+    '''
+    Compares redrawing a size x size [m] map of random crowds with the compiled stampRect pass
+    of SocialCanvas against compositing the people one after the other with stampKernel
+    '''
+    from context_aware_navigation.social_zones import KernelBank, SocialCanvas, stampKernel
+    bank = KernelBank(density, 253)
+    shape = (round(size/density), round(size/density))
+    canvas = SocialCanvas(shape, bank, dtype=np.uint8)
+    reference = np.zeros(shape, dtype=np.uint8)
+    rng = np.random.default_rng(0)
+    for n in crowds:
+        footprints = [(int(row), int(col), bank.key(theta, speed)) for row, col, theta, speed in
+                      zip(rng.integers(0, shape[0], n), rng.integers(0, shape[1], n),
+                          rng.uniform(-np.pi, np.pi, n), rng.uniform(0, 1.5, n))]
+        # builds the kernels and compiles stampRect outside of the measurement
+        canvas.redraw(footprints)
+        start = time.perf_counter()
+        for repeat in range(repeats):
+            canvas.redraw(footprints)
+        compiled = (time.perf_counter() - start)/repeats
+        start = time.perf_counter()
+        for repeat in range(repeats):
+            reference.fill(0)
+            for row, col, key in footprints:
+                stampKernel(reference, bank.getKey(key), row, col)
+        serial = (time.perf_counter() - start)/repeats
+        assert np.array_equal(canvas.map, reference)
+        print(f"{n:4d} people: stampRect {1e3*compiled:7.2f}ms  stampKernel {1e3*serial:7.2f}ms")
+
+
+def benchmarkGroups(crowds=(10, 50, 100), size: float = 15, repeats: int = 200):
+    '''Time of the F-formation detection of random standing crowds on a size x size [m] map'''
+    from context_aware_navigation.fformation import FFormationDetector
+    detector = FFormationDetector()
+    rng = np.random.default_rng(0)
+    for n in crowds:
+        positions = rng.uniform(-size/2, size/2, (n, 2))
+        headings = rng.uniform(-np.pi, np.pi, n)
+        speeds = np.zeros(n)
+        start = time.perf_counter()
+        for repeat in range(repeats):
+            labels, oSpaces = detector.detect(positions, headings, speeds)
+        print(f"{n:4d} people: {1e3*(time.perf_counter() - start)/repeats:6.3f}ms  {len(oSpaces)} groups")
+
+
+def benchmarkForecast(steps=(0, 1, 2, 4, 8), people: int = 50, horizon: float = 2.0, density: float = 0.05,
+                      size: float = 15, frames: int = 100, dt: float = 0.05):
+    '''
+    Time of one update of the social map of people walking through a size x size [m] map
+    as a function of the forecast steps stamped for every person
+    '''
+    from context_aware_navigation.social_zones import KernelBank, SocialCanvas, peopleFootprints
+    bank = KernelBank(density, 253)
+    shape = (round(size/density), round(size/density))
+    for forecastSteps in steps:
+        rng = np.random.default_rng(0)
+        crowd = np.zeros((people, 6))
+        crowd[:, :2] = rng.uniform(0, size, (people, 2))
+        crowd[:, 1] *= -1
+        heading = rng.uniform(-np.pi, np.pi, people)
+        crowd[:, 3:5] = rng.uniform(0.5, 1.5, (people, 1))*np.stack((np.cos(heading), np.sin(heading)), axis=1)
+        canvas = SocialCanvas(shape, bank, dtype=np.uint8)
+        times = []
+        # the first frames build the kernels and compile the stamping
+        for frame in range(frames + 10):
+            crowd[:, :2] += dt*crowd[:, 3:5]
+            start = time.perf_counter()
+            footprints, headings, speeds = peopleFootprints(crowd, bank, density, forecastHorizon=horizon,
+                                                            forecastSteps=forecastSteps)
+            canvas.update(footprints)
+            times.append(time.perf_counter() - start)
+        times = 1e3*np.array(times[10:])
+        print(f"{forecastSteps:2d} steps: {len(footprints):4d} stamps  median {np.median(times):6.2f}ms  "
+              f"p95 {np.percentile(times, 95):6.2f}ms")
+
+
+def referenceMap(footprints, bank, origin: tuple, shape: tuple) -> np.ndarray:
+    '''Map of footprints drawn from scratch one after the other with stampKernel, the reference of SocialCanvas'''
+    from context_aware_navigation.social_zones import stampKernel
+    socialMap = np.zeros(shape, dtype=np.uint8)
+    for row, col, key in footprints:
+        stampKernel(socialMap, bank.getKey(key), row - origin[0], col - origin[1])
+    return socialMap
+
+
+def kernelDirection(kernel: np.ndarray) -> float:
+    '''Direction of the cost mass of kernel around its center pixel, counterclockwise from x in the world [rad]'''
+    rows, cols = np.nonzero(kernel)
+    weights = kernel[rows, cols].astype(float)
+    center = len(kernel)//2
+    # rows grow against y
+    return np.arctan2(-np.sum(weights*(rows - center)), np.sum(weights*(cols - center)))
+
+
+def orientationError(bank, headings: int = 36, speeds=(0.0, 1.0, 2.0)) -> float:
+    '''
+    Largest angle between the heading of a person and the direction its kernel points to [rad]
+
+    The zones are longer in front of a person, so the cost mass of a kernel lies in the direction
+    the person faces. This checks the kernels against the headings they are meant for, independent
+    of how the bank builds them.
+    '''
+    error = 0.0
+    for heading in np.linspace(-np.pi, np.pi, headings, endpoint=False) + 0.1:
+        for speed in speeds:
+            error = max(error, abs(np.angle(np.exp(1j*(kernelDirection(bank.get(heading, speed)) - heading)))))
+    return error
+
+
+def simulateCrowd(people: int, size: float, frames: int, dt: float = 0.05, seed: int = 0):
+    '''
+    Yields the robot position and the (people, 6) People arrays of frames of a crowd walking
+    around the robot driving through a map of size x size [m]
+    '''
+    rng = np.random.default_rng(seed)
+    crowd = np.zeros((people, 6))
+    crowd[:, :2] = rng.uniform(-size/2, size/2, (people, 2))
+    crowd[:, 2] = rng.uniform(-np.pi, np.pi, people)
+    # a third of the people stands, the others walk
+    walking = rng.random(people) < 2/3
+    crowd[walking, 3:5] = rng.normal(0, 0.8, (walking.sum(), 2))
+    robot = np.zeros(2)
+    for frame in range(frames):
+        crowd[:, :2] += dt*crowd[:, 3:5]
+        crowd[:, 3:5] += rng.normal(0, 0.05, (people, 2))*walking[:, None]
+        robot += dt*np.array([0.5, 0.2])
+        yield robot, crowd
+
+
+def benchmarkGeneration(crowds=(0, 10, 50, 200), densities=(0.05, 0.1), sizes=(15,), frames: int = 100,
+                        forecastSteps: int = 0, check: bool = True, verbose: bool = True) -> list:
+    '''
+    Runs the generation of the social map of SocialMapGenerator without ROS and TF for simulated crowds
+    on every combination of crowd size, density [m/px] and map size [m]
+
+    Every configuration runs the frames once for the latency, once under tracemalloc for the memory
+    allocated by Python and numpy per frame and, with check, once comparing every frame with referenceMap.
+    Allocations of the compiled kernels are not traced. As referenceMap stamps the same kernels, check
+    also compares the direction of the kernels with the headings of the people with orientationError.
+
+    Return
+    ----------
+    results: one dict per configuration with the latency percentiles [ms], the peak allocation per
+        frame [bytes], the kernels built while measuring the latency, the number of frames that
+        differ from the reference and the orientation error of the kernels [deg]
+    '''
+    from context_aware_navigation.social_zones import KernelBank, SocialCanvas, peopleFootprints, worldCell
+    results = []
+    for density in densities:
+        bank = KernelBank(density, 253)
+        orientation = np.degrees(orientationError(bank)) if check else 0.0
+        for size in sizes:
+            shape = (round(size/density), round(size/density))
+            for people in crowds:
+                def frame(canvas, robot, crowd):
+                    footprints, headings, speeds = peopleFootprints(
+                        crowd, bank, density, forecastHorizon=2.0, forecastSteps=forecastSteps)
+                    robotRow, robotCol = (int(cell) for cell in worldCell(robot[0], robot[1], density))
+                    canvas.moveTo(robotRow - shape[0]//2, robotCol - shape[1]//2)
+                    canvas.update(footprints)
+                    return footprints
+
+                # warm up builds the kernels and compiles the stamping
+                canvas = SocialCanvas(shape, bank, dtype=np.uint8)
+                for robot, crowd in simulateCrowd(people, size, 10):
+                    frame(canvas, robot, crowd)
+                canvas = SocialCanvas(shape, bank, dtype=np.uint8)
+                misses = bank.misses
+                latencies = []
+                for robot, crowd in simulateCrowd(people, size, frames):
+                    start = time.perf_counter()
+                    frame(canvas, robot, crowd)
+                    latencies.append(time.perf_counter() - start)
+                latencies = 1e3*np.array(latencies)
+                misses = bank.misses - misses
+
+                canvas = SocialCanvas(shape, bank, dtype=np.uint8)
+                allocated = 0
+                tracemalloc.start()
+                for robot, crowd in simulateCrowd(people, size, frames):
+                    tracemalloc.reset_peak()
+                    current = tracemalloc.get_traced_memory()[0]
+                    frame(canvas, robot, crowd)
+                    allocated = max(allocated, tracemalloc.get_traced_memory()[1] - current)
+                tracemalloc.stop()
+
+                mismatches = 0
+                if check:
+                    canvas = SocialCanvas(shape, bank, dtype=np.uint8)
+                    for robot, crowd in simulateCrowd(people, size, frames):
+                        footprints = frame(canvas, robot, crowd)
+                        mismatches += not np.array_equal(
+                            canvas.map, referenceMap(footprints, bank, canvas.origin, shape))
+
+                result = dict(people=people, density=density, size=size, frames=frames,
+                              p50=np.percentile(latencies, 50), p95=np.percentile(latencies, 95),
+                              p99=np.percentile(latencies, 99), max=latencies.max(),
+                              allocated=allocated, kernelMisses=misses, mismatches=mismatches,
+                              orientationError=orientation)
+                results.append(result)
+                if verbose:
+                    print(f"{people:4d} people {density:5.3f}m/px {size:4.0f}m: p50 {result['p50']:6.2f}ms  "
+                          f"p95 {result['p95']:6.2f}ms  p99 {result['p99']:6.2f}ms  max {result['max']:6.2f}ms  "
+                          f"allocated {allocated/1024:7.1f}KiB  {misses:4d} kernels built  " +
+                          (f"{mismatches} of {frames} frames differ from the reference  "
+                           f"kernels {orientation:.1f}deg off" if check else ''))
+    return results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the social map generation without ROS')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    startup = subparsers.add_parser('startup', help='startup time of the kernels with and without caches')
+    startup.add_argument('--runs', type=int, default=3)
+    startup.add_argument('--density', type=float, default=0.05)
+    startup.add_argument('--people', type=int, default=5)
+    stamping = subparsers.add_parser('stamping', help='redraw time of crowds with the compiled and the serial stamping')
+    stamping.add_argument('--crowds', type=int, nargs='+', default=[1, 3, 10, 50, 100, 300])
+    stamping.add_argument('--density', type=float, default=0.05)
+    groups = subparsers.add_parser('groups', help='time of the F-formation detection')
+    groups.add_argument('--crowds', type=int, nargs='+', default=[10, 50, 100])
+    forecast = subparsers.add_parser('forecast', help='update time of walking people by forecast steps')
+    forecast.add_argument('--steps', type=int, nargs='+', default=[0, 1, 2, 4, 8])
+    forecast.add_argument('--people', type=int, default=50)
+    forecast.add_argument('--horizon', type=float, default=2.0)
+    generation = subparsers.add_parser(
+        'generation', help='latency, allocations and equivalence of the social map generation of simulated crowds')
+    generation.add_argument('--crowds', type=int, nargs='+', default=[0, 10, 50, 200])
+    generation.add_argument('--densities', type=float, nargs='+', default=[0.05, 0.1])
+    generation.add_argument('--sizes', type=float, nargs='+', default=[15])
+    generation.add_argument('--frames', type=int, default=100)
+    generation.add_argument('--forecast-steps', type=int, default=0)
+    generation.add_argument('--no-check', action='store_true', help='skip the comparison with the reference')
+    generation.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(args)
+    if args.benchmark == 'startup':
+        benchmarkStartup(args.runs, args.density, args.people)
+    elif args.benchmark == 'stamping':
+        benchmarkStamping(args.crowds, args.density)
+    elif args.benchmark == 'groups':
+        benchmarkGroups(args.crowds)
+    elif args.benchmark == 'forecast':
+        benchmarkForecast(args.steps, args.people, args.horizon)
+    elif args.benchmark == 'generation':
+        results = benchmarkGeneration(args.crowds, args.densities, args.sizes, args.frames,
+                                      args.forecast_steps, check=not args.no_check)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=2)
+        if any(result['mismatches'] or result['orientationError'] > np.degrees(ORIENTATION_TOLERANCE)
+               for result in results):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    # python3 -m context_aware_navigation.benchmark startup|stamping|groups|forecast|generation
+    main()
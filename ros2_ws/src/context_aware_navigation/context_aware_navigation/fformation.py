@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class FFormationDetector(object):
+    '''
+    Finds groups of people standing in an F-formation, people that are close to each other and
+    face a shared point, their O-space, from their positions and headings
+
+    Every person votes for the point stride in front of them. Two people are linked when they
+    are closer than maxDistance and their votes are closer than tolerance, the groups are the
+    connected components of the links. Everything is computed on (N, N) arrays, so it is cheap
+    enough to run for every People message.
+
+    Parameters
+    ----------
+    maxDistance: people further apart are never in the same group [m]
+    stride: distance of the O-space center in front of a person [m]
+    tolerance: distance between the O-space centers of two people of the same group [m]
+    maxSpeed: faster people are walking and not part of an F-formation [m/s]
+    bodyRadius: part of the distance to the center taken up by the people themselves [m]
+    minRadius: smallest radius of an O-space [m]
+    '''
+
+    def __init__(self, maxDistance: float = 2.0, stride: float = 0.7, tolerance: float = 0.6,
+                 maxSpeed: float = 0.2, bodyRadius: float = 0.25, minRadius: float = 0.2):
+        self.maxDistance = maxDistance
+        self.stride = stride
+        self.tolerance = tolerance
+        self.maxSpeed = maxSpeed
+        self.bodyRadius = bodyRadius
+        self.minRadius = minRadius
+
+    def link(self, positions: np.ndarray, headings: np.ndarray, speeds: np.ndarray) -> np.ndarray:
+        '''Returns the (N, N) symmetric matrix of the people that belong to the same group pairwise'''
+        votes = positions + self.stride*np.stack((np.cos(headings), np.sin(headings)), axis=1)
+        standing = speeds <= self.maxSpeed
+        linked = standing[:, None] & standing[None]
+        # squared distances, the square roots are not needed for the thresholds
+        for points, threshold in ((positions, self.maxDistance), (votes, self.tolerance)):
+            x, y = points[:, 0], points[:, 1]
+            linked &= (x[:, None] - x[None])**2 + (y[:, None] - y[None])**2 < threshold**2
+        np.fill_diagonal(linked, False)
+        return linked
+
+    def detect(self, positions: np.ndarray, headings: np.ndarray, speeds: np.ndarray) -> tuple:
+        '''
+        Groups the people at positions (N, 2) facing headings (N,) [rad] moving with speeds (N,) [m/s]
+
+        Return
+        ----------
+        labels: (N,) group of every person, -1 for people that are not in a group
+        oSpaces: (G, 3) x, y, radius of the O-space of every group, group g is row g
+        '''
+        n = len(positions)
+        linked = self.link(positions, headings, speeds)
+        # every person takes the lowest label of its neighbours until the components agree
+        labels = np.arange(n)
+        while True:
+            neighbours = np.where(linked, labels[None], n).min(axis=1, initial=n)
+            update = np.minimum(labels, neighbours)
+            update = update[update]
+            if np.array_equal(update, labels):
+                break
+            labels = update
+        grouped = linked.any(axis=1)
+        roots, labels[grouped] = np.unique(labels[grouped], return_inverse=True)
+        labels[~grouped] = -1
+        if not len(roots):
+            return labels, np.zeros((0, 3))
+
+        members = labels[grouped]
+        counts = np.bincount(members)
+        votes = positions[grouped] + self.stride*np.stack(
+            (np.cos(headings[grouped]), np.sin(headings[grouped])), axis=1)
+        centers = np.stack((np.bincount(members, votes[:, 0]), np.bincount(members, votes[:, 1])), axis=1) \
+            / counts[:, None]
+        distances = np.hypot(*(positions[grouped] - centers[members]).T)
+        radii = np.maximum(np.bincount(members, distances)/counts - self.bodyRadius, self.minRadius)
+        return labels, np.column_stack((centers, radii))
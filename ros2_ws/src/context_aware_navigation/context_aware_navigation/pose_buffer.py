@@ -0,0 +1,120 @@
+import threading
+
+import numpy as np
+
+
+def wrapAngle(angle):
+    return (angle + np.pi) % (2*np.pi) - np.pi
+
+
+def se2Interpolate(a: np.ndarray, b: np.ndarray, alpha: float) -> np.ndarray:
+    '''
+    Pose at alpha along the SE(2) geodesic from pose a to pose b, both x, y, yaw
+
+    The motion from a to b is taken as a constant twist in the frame of a, so a robot turning
+    while driving is interpolated on its arc instead of the chord. alpha above 1 extrapolates.
+    '''
+    cos, sin = np.cos(a[2]), np.sin(a[2])
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    # b in the frame of a
+    x, y = cos*dx + sin*dy, -sin*dx + cos*dy
+    theta = wrapAngle(b[2] - a[2])
+    if abs(theta) < 1e-9:
+        u, v = alpha*x, alpha*y
+    else:
+        # log of the relative pose, the translation of the twist, then exp of alpha times the twist
+        half = theta/2
+        cot = half/np.tan(half)
+        vx, vy = cot*x + half*y, -half*x + cot*y
+        angle = alpha*theta
+        s, c = np.sin(angle)/theta, (1 - np.cos(angle))/theta
+        u, v = s*vx - c*vy, c*vx + s*vy
+    return np.array([a[0] + cos*u - sin*v, a[1] + sin*u + cos*v, wrapAngle(a[2] + alpha*theta)])
+
+
+def se2Compose(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    '''Pose b, given in the frame of pose a, in the frame a is given in, both x, y, yaw'''
+    cos, sin = np.cos(a[2]), np.sin(a[2])
+    return np.array([a[0] + cos*b[0] - sin*b[1], a[1] + sin*b[0] + cos*b[1], wrapAngle(a[2] + b[2])])
+
+
+def transformPeople(people: np.ndarray, pose: np.ndarray) -> np.ndarray:
+    '''
+    People (N, 6) x, y, theta, xdot, ydot, thetadot given in the frame of pose x, y, yaw,
+    in the frame pose is given in
+    '''
+    cos, sin = np.cos(pose[2]), np.sin(pose[2])
+    moved = people.copy()
+    moved[:, 0] = pose[0] + cos*people[:, 0] - sin*people[:, 1]
+    moved[:, 1] = pose[1] + sin*people[:, 0] + cos*people[:, 1]
+    moved[:, 2] = people[:, 2] + pose[2]
+    moved[:, 3] = cos*people[:, 3] - sin*people[:, 4]
+    moved[:, 4] = sin*people[:, 3] + cos*people[:, 4]
+    return moved
+
+
+class PoseBuffer(object):
+    '''
+    Time indexed buffer of the latest robot poses x, y, yaw in one frame, filled from TF or odometry
+
+    Poses are looked up at the stamps of messages without waiting for TF, between two samples
+    they are interpolated on SE(2), after the newest one extrapolated for at most maxExtrapolation.
+    Times more than maxAge after the newest sample have no pose, so a pose source that stopped is
+    not used forever. Samples that are not newer than the newest one are ignored, a jump back in time
+    clears the buffer.
+
+    Parameters
+    ----------
+    capacity: number of samples kept
+    maxExtrapolation: time a pose is extrapolated after the newest sample at most [s]
+    maxAge: time after the newest sample after which there is no pose [s]
+    '''
+
+    def __init__(self, capacity: int = 200, maxExtrapolation: float = 0.1, maxAge: float = 0.5):
+        self.times = np.zeros(capacity)
+        self.poses = np.zeros((capacity, 3))
+        self.count = 0
+        self.maxExtrapolation = maxExtrapolation
+        self.maxAge = maxAge
+        self.lock = threading.Lock()
+
+    @property
+    def latest(self) -> float:
+        '''Time of the newest sample, None when the buffer is empty'''
+        with self.lock:
+            return self.times[self.count - 1] if self.count else None
+
+    def clear(self):
+        with self.lock:
+            self.count = 0
+
+    def add(self, time: float, x: float, y: float, yaw: float):
+        with self.lock:
+            if self.count and time <= self.times[self.count - 1]:
+                if time < self.times[self.count - 1] - 1.0:
+                    # the clock jumped back, like a restarted bag or simulation
+                    self.count = 0
+                else:
+                    return
+            if self.count == len(self.times):
+                self.times[:-1] = self.times[1:]
+                self.poses[:-1] = self.poses[1:]
+                self.count -= 1
+            self.times[self.count] = time
+            self.poses[self.count] = x, y, yaw
+            self.count += 1
+
+    def at(self, time: float) -> np.ndarray:
+        '''
+        Pose x, y, yaw at time, clamped to the oldest sample and to maxExtrapolation after the newest one,
+        None when the buffer is empty or time is more than maxAge after the newest sample
+        '''
+        with self.lock:
+            if self.count == 0 or time > self.times[self.count - 1] + self.maxAge:
+                return None
+            times, poses = self.times[:self.count], self.poses[:self.count]
+            if self.count == 1 or time <= times[0]:
+                return poses[0].copy()
+            i = min(int(np.searchsorted(times, time)), self.count - 1)
+            time = min(time, times[-1] + self.maxExtrapolation)
+            return se2Interpolate(poses[i - 1], poses[i], (time - times[i - 1])/(times[i] - times[i - 1]))
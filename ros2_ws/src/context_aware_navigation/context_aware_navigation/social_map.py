@@ -0,0 +1,482 @@
+import rclpy
+from rclpy.node import Node
+
+from tf2_ros import TransformException
+from tf2_ros.buffer import Buffer
+from tf2_ros.transform_listener import TransformListener
+
+import array
+import threading
+import time
+import numpy as np
+from rcl_interfaces.msg import SetParametersResult
+from multi_person_tracker_interfaces.msg import People
+from sensor_msgs.msg import Image, RegionOfInterest
+from nav_msgs.msg import OccupancyGrid, Odometry
+from map_msgs.msg import OccupancyGridUpdate
+from rclpy.qos import QoSProfile, DurabilityPolicy
+from cv_bridge import CvBridge
+from context_aware_navigation.social_zones import DecayingLayer, SocialCanvas, SocialPyramid, cachedKernelBank, \
+    peopleFootprints, worldCell
+from context_aware_navigation.fformation import FFormationDetector
+from context_aware_navigation.pose_buffer import PoseBuffer, se2Compose, transformPeople
+from std_msgs.msg import Header
+from multi_person_tracker.tracing import Tracer, stampToNs
+
+
+# costs 0..255 to occupancy values like the costmap publisher of nav2, 255 (no information) is unknown
+OCCUPANCY_LUT = np.array([0] + [((i - 1)*97)//251 + 1 for i in range(1, 253)] + [99, 100, -1], dtype=np.int8)
+OUTPUT_MODES = ('passthrough', 'mono8', 'occupancy_grid')
+MAX_FORECAST_STEPS = 10
+# parameters the kernels are built from, changing them rebuilds the kernel bank while running
+KERNEL_PARAMETERS = ('maxcost', 'social_cost_size', 'sigma_front', 'sigma_side', 'sigma_back', 'forecast_decay')
+# parameters that are simply read by generate() and take effect with the next map
+LIVE_PARAMETERS = ('group_zones', 'forecast_horizon', 'forecast_steps', 'pose_max_age')
+# parameters the publishers, buffers and pose source are set up with, they cannot change while running
+STARTUP_PARAMETERS = ('output_mode', 'persistence_half_life', 'pyramid_levels', 'pyramid_fine_size',
+                      'publish_region', 'world_frame', 'pose_source', 'pose_rate')
+# largest maxcost, the kernels are uint8 and 255 is the lethal cost of nav2
+MAX_MAXCOST = 254
+
+
+def kernelParameterError(values: dict) -> str:
+    '''Reason why the kernel parameters in values cannot be used, an empty string when they can'''
+    for name, value in values.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+            return f'{name} must be a positive number, got {value!r}'
+    if values.get('maxcost', 0) > MAX_MAXCOST:
+        return f'maxcost must be at most {MAX_MAXCOST}, got {values["maxcost"]}'
+    if values.get('forecast_decay', 0) > 1:
+        return f'forecast_decay must be at most 1, got {values["forecast_decay"]}'
+    return ''
+
+
+def liveParameterError(values: dict) -> str:
+    '''Reason why the LIVE_PARAMETERS in values cannot be used, an empty string when they can'''
+    for name, value in values.items():
+        if name == 'group_zones':
+            if not isinstance(value, bool):
+                return f'group_zones must be a bool, got {value!r}'
+        elif isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            return f'{name} must be a non-negative number, got {value!r}'
+    if values.get('pose_max_age', 1) == 0:
+        return 'pose_max_age must be positive'
+    return ''
+
+
+def yawOf(q) -> float:
+    '''Rotation around z of the quaternion q'''
+    return float(np.arctan2(2*(q.w*q.z + q.x*q.y), 1 - 2*(q.y*q.y + q.z*q.z)))
+
+
+def peopleToArray(msg: People) -> np.ndarray:
+    '''Converts a People message into a (N, 6) array of x, y, theta, xdot, ydot, thetadot'''
+    return np.array([[person.position.x, person.position.y, person.position.z,
+                      person.velocity.x, person.velocity.y, person.velocity.z]
+                     for person in msg.people], dtype=float).reshape(-1, 6)
+
+
+class SocialMapGenerator(Node):
+    '''
+    Generates an image of the social zones of the people around the robot
+
+    Parameters
+    ----------
+    height: height of the map [m]
+    width: width of the map [m]
+    density: size of a pixel [m/px]
+    maxcost: default of the maxcost parameter, cost at the center of a social zone
+    subscribe: generate a map for every People message, False when the maps are requested with generate()
+    publishRegion: default of the publish_region parameter, only publish the changed part of the map
+        on social_map_region with its offset on social_map_region_roi
+    outputMode: default of the output_mode parameter
+        passthrough: float32 image on social_map
+        mono8: uint8 image on social_map
+        occupancy_grid: OccupancyGrid in world_frame on social_map_grid when the window
+            moved and OccupancyGridUpdate of the changed region on social_map_grid_updates otherwise
+    groupZones: default of the group_zones parameter, also stamp the O-space of every F-formation
+        found geometrically from the tracks
+    persistenceHalfLife: default of the persistence_half_life parameter [s], when positive the maximum
+        of the past maps decaying with this half-life is published on social_map_persistent
+        in the output mode, 0 disables it
+    forecastHorizon: default of the forecast_horizon parameter [s], when positive walking people are
+        also stamped at forecast_steps positions extrapolated with their velocity up to the horizon,
+        with a cost decaying by forecast_decay per step
+    pyramidLevels: default of the pyramid_levels parameter, when positive the center of the map of
+        pyramid_fine_size [m] is published on social_map_level0 and the whole map with 2**k times
+        larger cells on social_map_level1 to social_map_level{pyramid_levels}, in the output mode
+
+    The map is a window of a grid anchored in world_frame, odom by default, so it only moves when
+    the robot does. The pose of base_link in world_frame at the stamp of the people is interpolated
+    from poses sampled from TF at pose_rate [Hz], or taken from the odometry on odom when pose_source
+    is odom, so generate() does not wait for TF. When the newest pose is more than pose_max_age [s]
+    older than the people, their message is skipped with a warning. People in another frame than world_frame are moved
+    into it with that pose and the latest transform of their frame to base_link, their frame has to
+    be fixed to the robot, like the camera_link of the tracker.
+
+    The shape of the zones is set by the parameters maxcost, social_cost_size [m], sigma_front,
+    sigma_side, sigma_back [m] and forecast_decay. Setting them while running builds the new kernels
+    in a background thread, the maps are drawn with the old ones until the new ones are swapped in.
+    group_zones, forecast_horizon, forecast_steps and pose_max_age apply to the next map, the other
+    parameters can only be set when the node starts.
+    '''
+
+    def __init__(self, height, width, density, maxcost, subscribe: bool = True, publishRegion: bool = False,
+                 outputMode: str = 'passthrough', groupZones: bool = False, persistenceHalfLife: float = 0.0,
+                 forecastHorizon: float = 0.0, pyramidLevels: int = 0):
+        super().__init__('social_map_generator')
+        self.width = width
+        self.height = height
+        self.density = density  # px/m
+        self.socialCostSize = self.declare_parameter('social_cost_size', 4.0).value
+        self.maxcost = self.declare_parameter('maxcost', float(maxcost)).value
+        # %standard diviations %adjust to get different shapes
+        self.sigmaFront = self.declare_parameter('sigma_front', 2.0).value
+        self.sigmaSide = self.declare_parameter('sigma_side', 4/3).value
+        self.sigmaBack = self.declare_parameter('sigma_back', 1.0).value
+        # the front of a walking person is stretched by its speed
+        self.maxSpeed = 2.0  # m/s
+        self.speedStep = 0.25  # m/s
+        self.minWalkingSpeed = 0.2  # m/s, slower people keep their body orientation
+        # the space people are about to walk into, the steps are bounded to bound the extra stamps
+        self.forecastHorizon = float(self.declare_parameter('forecast_horizon', float(forecastHorizon)).value)
+        self.forecastSteps = min(max(self.declare_parameter('forecast_steps', 3).value, 0), MAX_FORECAST_STEPS)
+        self.forecastDecay = self.declare_parameter('forecast_decay', 0.7).value
+        # zones are looked up by 2 degree heading bins instead of rotating one zone per person,
+        # the standing zones are loaded from the cache of the last start with the same parameters
+        self.kernelValues = {name: self.get_parameter(name).value for name in KERNEL_PARAMETERS}
+        error = kernelParameterError(self.kernelValues)
+        if error:
+            raise ValueError(error)
+        self.kernelValues = {name: float(value) for name, value in self.kernelValues.items()}
+        self.kernels = self.buildKernels(self.kernelValues)
+        # kernels rebuilt after a parameter change, swapped in by the next generate()
+        self.kernelLock = threading.Lock()
+        self.pendingKernels = None
+        self.kernelRequest = 0
+
+        # the map is kept between messages anchored in world_frame and only
+        # recomposed where people changed or the window moved
+        # costs are stamped directly as uint8, the kernels have no finer values
+        self.canvas = SocialCanvas(
+            (round(self.height/self.density), round(self.width/self.density)), self.kernels, dtype=np.uint8)
+        self.canvas.warm()
+        self.socialMap = self.canvas.map
+        self.dirty = None
+        self.center = (np.shape(self.socialMap)[
+                       0]/2, np.shape(self.socialMap)[1]/2)  # [px]
+
+        # groups standing together get a shared zone without running the interaction detector
+        self.groupZones = self.declare_parameter('group_zones', groupZones).value
+        self.fformations = FFormationDetector(maxSpeed=self.minWalkingSpeed)
+        self.groups = np.zeros(0, dtype=int)  # group of every person of the last generate(), -1 for none
+
+        self.outputMode = self.declare_parameter('output_mode', outputMode).value
+        if self.outputMode not in OUTPUT_MODES:
+            self.get_logger().error(
+                f'Unknown output_mode {self.outputMode}, use one of {OUTPUT_MODES}')
+            self.outputMode = 'passthrough'
+        # people missed for a few frames are remembered instead of vanishing from the map
+        halfLife = float(self.declare_parameter('persistence_half_life', float(persistenceHalfLife)).value)
+        self.memory = DecayingLayer(self.canvas, halfLife) if halfLife > 0 else None
+        # consumers that need less resolution subscribe to a coarser level of the same map
+        levels = self.declare_parameter('pyramid_levels', pyramidLevels).value
+        fineSize = round(float(self.declare_parameter('pyramid_fine_size', 5.0).value)/self.density)
+        self.pyramid = SocialPyramid(self.socialMap, levels, (fineSize, fineSize)) if levels > 0 else None
+        self.gridFrame = None
+        self.gridOrigin = None  # window origin of the last published OccupancyGrid
+        self.publishRegion = self.declare_parameter('publish_region', publishRegion).value
+        if self.outputMode == 'occupancy_grid':
+            # late joiners get the last full grid, the updates are relative to it
+            self.grid_publisher = self.create_publisher(
+                OccupancyGrid, 'social_map_grid', QoSProfile(depth=1, durability=DurabilityPolicy.TRANSIENT_LOCAL))
+            self.grid_update_publisher = self.create_publisher(
+                OccupancyGridUpdate, 'social_map_grid_updates', 10)
+        else:
+            self.publisher_ = self.create_publisher(Image, 'social_map', 10)
+        if self.memory is not None:
+            self.persistent_publisher = self.create_publisher(
+                OccupancyGrid if self.outputMode == 'occupancy_grid' else Image, 'social_map_persistent', 10)
+        if self.pyramid is not None:
+            self.level_publishers = [self.create_publisher(
+                OccupancyGrid if self.outputMode == 'occupancy_grid' else Image, f'social_map_level{level}', 10)
+                for level in range(len(self.pyramid.levels))]
+        if self.publishRegion and self.outputMode != 'occupancy_grid':
+            self.region_publisher = self.create_publisher(Image, 'social_map_region', 10)
+            self.roi_publisher = self.create_publisher(RegionOfInterest, 'social_map_region_roi', 10)
+        self.cvBridge = CvBridge()
+        if subscribe:
+            self.people_sub = self.create_subscription(
+                People,
+                'people',
+                self.people_callback,
+                10)
+        # tf listener stuff so we can transform people into there
+        self.tf_buffer = Buffer(cache_time=rclpy.duration.Duration(seconds=2))
+        self.tf_listener = TransformListener(self.tf_buffer, self,spin_thread=True)
+        # robot poses are sampled ahead of the people instead of waiting for TF in the callback
+        self.worldFrame = self.declare_parameter('world_frame', 'odom').value
+        self.poses = PoseBuffer(maxAge=self.declare_parameter('pose_max_age', 0.5).value)  # of base_link in world_frame
+        # x, y, yaw of base_link in world_frame at the last generate(), the people are moved with it
+        self.robotPose = None
+        self.sensorPoses = {}  # latest x, y, yaw of the frames of the people in base_link
+        if self.declare_parameter('pose_source', 'tf').value == 'odom':
+            self.odom_sub = self.create_subscription(Odometry, 'odom', self.odom_callback, 50)
+        else:
+            self.pose_timer = self.create_timer(
+                1/self.declare_parameter('pose_rate', 50.0).value, self.samplePose)
+        # latency tracing from the people stamp, enabled with PERCEPTION_TRACING=1
+        self.tracer = Tracer.fromEnvironment(
+            'social_map_generator', clock=lambda: self.get_clock().now().nanoseconds)
+        # after all parameters are declared, declaring them also runs the callback
+        self.add_on_set_parameters_callback(self.onSetParameters)
+
+    def buildKernels(self, values: dict):
+        return cachedKernelBank(self.density, values['maxcost'], values['social_cost_size'],
+                                values['sigma_front'], values['sigma_side'], values['sigma_back'],
+                                headingStep=np.deg2rad(2), speedStep=self.speedStep,
+                                maxSpeed=self.maxSpeed, memoryLimit=32*1024**2,
+                                forecastDecay=values['forecast_decay'])
+
+    def onSetParameters(self, parameters) -> SetParametersResult:
+        '''
+        Applies the LIVE_PARAMETERS and starts rebuilding the kernels in the background when a
+        parameter of the zones changed, changes of the STARTUP_PARAMETERS are rejected
+        '''
+        values = {parameter.name: parameter.value for parameter in parameters}
+        fixed = [name for name in STARTUP_PARAMETERS if name in values]
+        if fixed:
+            return SetParametersResult(
+                successful=False, reason=f'{", ".join(fixed)} can only be set when the node starts')
+        live = {name: value for name, value in values.items() if name in LIVE_PARAMETERS}
+        changed = {name: value for name, value in values.items() if name in KERNEL_PARAMETERS}
+        error = kernelParameterError(changed) or liveParameterError(live)
+        if error:
+            return SetParametersResult(successful=False, reason=error)
+        self.groupZones = live.get('group_zones', self.groupZones)
+        self.forecastHorizon = float(live.get('forecast_horizon', self.forecastHorizon))
+        self.forecastSteps = min(int(live.get('forecast_steps', self.forecastSteps)), MAX_FORECAST_STEPS)
+        self.poses.maxAge = float(live.get('pose_max_age', self.poses.maxAge))
+        if not changed:
+            return SetParametersResult(successful=True)
+        changed = {name: float(value) for name, value in changed.items()}
+        with self.kernelLock:
+            self.kernelValues = dict(self.kernelValues, **changed)
+            self.kernelRequest += 1
+            request = (self.kernelRequest, self.kernelValues)
+        threading.Thread(target=self.rebuildKernels, args=request, daemon=True).start()
+        return SetParametersResult(successful=True)
+
+    def rebuildKernels(self, request: int, values: dict):
+        start = time.perf_counter()
+        kernels = self.buildKernels(values)
+        with self.kernelLock:
+            # a later change is already being built
+            if request != self.kernelRequest:
+                return
+            self.pendingKernels = (kernels, values)
+        self.get_logger().info(f'Rebuilt the social zone kernels in {time.perf_counter() - start:.2f}s')
+
+    def swapKernels(self):
+        '''Draws the map with the kernels rebuilt since the last call'''
+        with self.kernelLock:
+            pending, self.pendingKernels = self.pendingKernels, None
+        if pending is None:
+            return
+        self.kernels, values = pending
+        self.maxcost, self.socialCostSize = values['maxcost'], values['social_cost_size']
+        self.sigmaFront, self.sigmaSide, self.sigmaBack = values['sigma_front'], values['sigma_side'], values['sigma_back']
+        self.forecastDecay = values['forecast_decay']
+        self.canvas.setBank(self.kernels)
+
+    def samplePose(self):
+        '''Adds the latest pose of base_link in world_frame from TF without waiting'''
+        try:
+            t = self.tf_buffer.lookup_transform(self.worldFrame, "base_link", rclpy.time.Time())
+        except TransformException:
+            return
+        self.poses.add(stampToNs(t.header.stamp)*1e-9, t.transform.translation.x,
+                       t.transform.translation.y, yawOf(t.transform.rotation))
+
+    def odom_callback(self, msg: Odometry):
+        if msg.header.frame_id != self.worldFrame:
+            self.get_logger().warn(
+                f'Odometry is in {msg.header.frame_id}, not in world_frame {self.worldFrame}', throttle_duration_sec=10)
+            return
+        self.poses.add(stampToNs(msg.header.stamp)*1e-9, msg.pose.pose.position.x,
+                       msg.pose.pose.position.y, yawOf(msg.pose.pose.orientation))
+
+    def robotPoseAt(self, stamp):
+        '''Pose x, y, yaw of base_link in world_frame at stamp, None when there is none yet'''
+        time = stampToNs(stamp)*1e-9
+        pose = self.poses.at(time)
+        if pose is not None:
+            return pose
+        latest = self.poses.latest
+        if latest is not None:
+            # the pose source stopped, a stale pose would put the people in the wrong place
+            self.get_logger().warn(
+                f'The newest pose of base_link in {self.worldFrame} is {time - latest:.2f}s older than the people, '
+                f'skipping them', throttle_duration_sec=5)
+            return None
+        # nothing sampled yet, only take the transform when it is already there
+        try:
+            t = self.tf_buffer.lookup_transform(self.worldFrame, "base_link", stamp)
+        except TransformException as ex:
+            self.get_logger().info(
+                f'No pose of base_link in {self.worldFrame} yet: {ex}')
+            return None
+        return np.array([t.transform.translation.x, t.transform.translation.y, yawOf(t.transform.rotation)])
+
+    def sensorPose(self, frame_id: str):
+        '''Latest pose x, y, yaw of frame_id in base_link without waiting, the last known one when TF has none'''
+        try:
+            t = self.tf_buffer.lookup_transform("base_link", frame_id, rclpy.time.Time())
+            self.sensorPoses[frame_id] = np.array(
+                [t.transform.translation.x, t.transform.translation.y, yawOf(t.transform.rotation)])
+        except TransformException as ex:
+            if frame_id not in self.sensorPoses:
+                self.get_logger().info(f'No transform from {frame_id} to base_link yet: {ex}')
+        return self.sensorPoses.get(frame_id)
+
+    def people_callback(self, msg: People):# save time for timing of node
+        socialMap = self.generate(peopleToArray(msg), msg.header.frame_id, msg.header.stamp)
+        if socialMap is None:
+            return
+        if self.outputMode == 'occupancy_grid':
+            self.publishGridUpdate(msg.header.stamp)
+        elif self.publishRegion:
+            self.publishChangedRegion(msg.header.stamp)
+        else:
+            self.publishMap(socialMap, msg.header.stamp)
+        if self.memory is not None:
+            self.publishMap(self.memory.map, msg.header.stamp, publisher=self.persistent_publisher)
+        if self.pyramid is not None:
+            self.publishPyramid(self.pyramid.levels, msg.header.stamp)
+        self.tracer.mark('social_map', stampToNs(msg.header.stamp),
+                         people=len(msg.people))
+
+    def generate(self, people: np.ndarray, frame_id: str, stamp):
+        '''
+        Draws the social zones of people (N, 6) x, y, theta, xdot, ydot, thetadot in frame_id into
+        a map centered on base_link at stamp, returns None when no robot pose is known yet
+
+        The map is a window of a grid anchored in world_frame, its center cell is the one of base_link,
+        so it is offset by less than a pixel from the exact robot position.
+        The returned map is updated in place by the next call, the changed rectangle is kept in self.dirty,
+        the persistent map in self.memory.map
+        '''
+        pose = self.robotPoseAt(stamp)
+        if pose is None:
+            return None
+        self.robotPose = pose
+        if frame_id != self.worldFrame:
+            sensor = self.sensorPose(frame_id)
+            if sensor is None:
+                return None
+            # the people are seen from the robot at stamp
+            people = transformPeople(people, se2Compose(pose, sensor))
+
+        self.swapKernels()
+        # world cells of the grid anchored in world_frame, the grid keeps the axes of world_frame
+        # whatever the yaw of the robot
+        robotRow, robotCol = (int(cell) for cell in worldCell(pose[0], pose[1], self.density))
+        self.canvas.moveTo(robotRow - int(self.center[0]), robotCol - int(self.center[1]))
+        self.gridFrame = self.worldFrame
+        # zones outside of the window are clipped
+        footprints, headings, speeds = peopleFootprints(
+            people, self.kernels, self.density, self.minWalkingSpeed, self.forecastHorizon, self.forecastSteps)
+        if self.groupZones:
+            self.groups, oSpaces = self.fformations.detect(people[:, :2], headings, speeds)
+            rows, cols = worldCell(oSpaces[:, 0], oSpaces[:, 1], self.density)
+            footprints += [(row, col, self.kernels.oSpaceKey(radius))
+                           for row, col, radius in zip(rows.tolist(), cols.tolist(), oSpaces[:, 2])]
+        self.dirty = self.canvas.update(footprints)
+        if self.memory is not None:
+            self.memory.update(stampToNs(stamp)*1e-9)
+        if self.pyramid is not None:
+            self.pyramid.update()
+        return self.socialMap
+
+    def publishMap(self, socialMap: np.ndarray, stamp, origin: tuple = None, publisher=None, density: float = None):
+        '''
+        Publishes the whole map in the output mode on publisher, the one of social_map by default,
+        origin is the world cell of its top left corner and density the size of its cells [m/px]
+        '''
+        if self.outputMode == 'occupancy_grid':
+            self.publishGrid(socialMap, stamp, origin or self.canvas.origin, publisher, density)
+            return
+        publisher = publisher or self.publisher_
+        social_mapHeader = Header()
+        social_mapHeader.frame_id = "base_link"
+        social_mapHeader.stamp = stamp
+        if self.outputMode == 'mono8':
+            publisher.publish(self.cvBridge.cv2_to_imgmsg(
+                socialMap, encoding="mono8", header=social_mapHeader))
+        else:
+            publisher.publish(self.cvBridge.cv2_to_imgmsg(
+                socialMap.astype(np.float32), encoding="passthrough", header=social_mapHeader))
+
+    def publishGrid(self, socialMap: np.ndarray, stamp, origin: tuple, publisher=None, density: float = None):
+        density = density or self.density
+        scale = int(round(density/self.density))
+        grid = OccupancyGrid()
+        grid.header.frame_id = self.gridFrame
+        grid.header.stamp = stamp
+        grid.info.map_load_time = stamp
+        grid.info.resolution = float(density)
+        grid.info.height, grid.info.width = socialMap.shape
+        # the grid starts at the bottom left cell, image rows grow against y
+        grid.info.origin.position.x = origin[1]*self.density
+        grid.info.origin.position.y = -(origin[0] + socialMap.shape[0]*scale - 1)*self.density
+        grid.info.origin.orientation.w = 1.0
+        grid.data = array.array('b', OCCUPANCY_LUT[socialMap[::-1]].tobytes())
+        if publisher is not None:
+            publisher.publish(grid)
+            return
+        # the updates on social_map_grid_updates are relative to this grid
+        self.grid_publisher.publish(grid)
+        self.gridOrigin = origin
+
+    def publishPyramid(self, levels: list, stamp, origin: tuple = None):
+        '''Publishes the levels of the pyramid of the map with the top left world cell origin'''
+        origin = origin or self.canvas.origin
+        fineOrigin = (origin[0] + self.pyramid.fineOffset[0], origin[1] + self.pyramid.fineOffset[1])
+        for level, (publisher, levelMap) in enumerate(zip(self.level_publishers, levels)):
+            self.publishMap(levelMap, stamp, fineOrigin if level == 0 else origin, publisher, self.density*2**level)
+
+    def publishGridUpdate(self, stamp):
+        '''Publishes the region changed by the last generate() as OccupancyGridUpdate, the whole grid when the window moved'''
+        if self.canvas.origin != self.gridOrigin:
+            self.publishGrid(self.socialMap, stamp, self.canvas.origin)
+            return
+        if self.dirty is None:
+            return
+        r0, r1, c0, c1 = self.dirty
+        update = OccupancyGridUpdate()
+        update.header.frame_id = self.gridFrame
+        update.header.stamp = stamp
+        update.x, update.width = c0, c1 - c0
+        update.y, update.height = self.socialMap.shape[0] - r1, r1 - r0
+        update.data = array.array('b', OCCUPANCY_LUT[self.socialMap[r0:r1, c0:c1][::-1]].tobytes())
+        self.grid_update_publisher.publish(update)
+
+    def publishChangedRegion(self, stamp):
+        '''Publishes the rectangle of the map that changed with the last generate(), nothing when the map did not change'''
+        if self.dirty is None:
+            return
+        r0, r1, c0, c1 = self.dirty
+        roi = RegionOfInterest()
+        roi.y_offset, roi.height = r0, r1 - r0
+        roi.x_offset, roi.width = c0, c1 - c0
+        self.roi_publisher.publish(roi)
+        social_mapHeader = Header()
+        social_mapHeader.frame_id = "base_link"
+        social_mapHeader.stamp = stamp
+        region = np.ascontiguousarray(self.socialMap[r0:r1, c0:c1])
+        if self.outputMode == 'mono8':
+            self.region_publisher.publish(self.cvBridge.cv2_to_imgmsg(
+                region, encoding="mono8", header=social_mapHeader))
+        else:
+            self.region_publisher.publish(self.cvBridge.cv2_to_imgmsg(
+                region.astype(np.float32), encoding="passthrough", header=social_mapHeader))
@@ -0,0 +1,573 @@
+import hashlib
+import os
+from collections import Counter, OrderedDict
+from typing import List
+
+import numpy as np
+from numba import njit, prange
+
+from context_aware_navigation.asymetricGausian import makeProxemicZones, SOCIAL_COST
+
+# distance in standard deviations at which a zone drops below the lowest cost level
+SOCIAL_REACH = np.sqrt(-2*np.log(SOCIAL_COST))
+# part of the cache key, increase when the kernels are generated differently
+KERNEL_VERSION = 2
+# heading bin of the keys of O-space kernels, their second entry is the radius in OSPACE_STEP
+OSPACE_HEADING = -1
+OSPACE_STEP = 0.1  # [m]
+# kernel banks kept in the cache directory, the least recently used ones are deleted
+CACHE_FILES = 4
+CACHE_DIR = os.environ.get('SOCIAL_ZONES_CACHE_DIR', os.path.join(
+    os.environ.get('ROS_HOME', os.path.join(os.path.expanduser('~'), '.ros')), 'social_zones'))
+
+
+class KernelBank(object):
+    '''
+    Social zone kernels quantized by heading and speed, built lazily and evicted least recently used
+
+    The kernels are kept in one preallocated (slots, size, size) array, so the bank never
+    grows past memoryLimit. Every kernel is centered on pixel (size//2, size//2) and is
+    enlarged beyond plotsize when the front of the fastest zone would be cut off.
+    The bank also holds the round O-space kernels of groups, keyed by oSpaceKey(), and the
+    kernels of forecast positions, whose cost is scaled by forecastDecay**level.
+
+    Parameters
+    ----------
+    density: size of a pixel [m/px]
+    maxcost: cost at the center of a zone
+    plotsize: minimum half width of a kernel [m]
+    sigmaFront: front standard deviation of a standing person [m]
+    sigmaSide: side standard deviation [m]
+    sigmaBack: back standard deviation [m]
+    headingStep: width of a heading bin [rad]
+    speedStep: width of a speed bin [m/s], the front sigma grows by the speed of the bin
+    maxSpeed: speeds above are drawn with the kernel of maxSpeed [m/s]
+    memoryLimit: bytes the kernels may use
+    forecastDecay: cost factor of every forecast step
+    '''
+
+    def __init__(self, density: float, maxcost: float, plotsize: float = 4, sigmaFront: float = 2,
+                 sigmaSide: float = 4/3, sigmaBack: float = 1, headingStep: float = np.deg2rad(2),
+                 speedStep: float = 0.25, maxSpeed: float = 2.0, memoryLimit: int = 32*1024**2,
+                 forecastDecay: float = 0.7):
+        self.density = density
+        self.maxcost = maxcost
+        self.plotsize = max(plotsize, SOCIAL_REACH*(sigmaFront + maxSpeed))
+        self.sigmaFront = sigmaFront
+        self.sigmaSide = sigmaSide
+        self.sigmaBack = sigmaBack
+        self.headingBins = int(round(2*np.pi/headingStep))
+        self.headingStep = 2*np.pi/self.headingBins
+        self.speedStep = speedStep
+        self.speedBins = int(np.floor(maxSpeed/speedStep)) + 1
+        self.forecastDecay = forecastDecay
+        self.grid = np.arange(-self.plotsize, self.plotsize, density)  # [m]
+        size = len(self.grid)
+        slots = max(1, min(self.headingBins*self.speedBins, memoryLimit // (size*size)))
+        self.kernels = np.zeros((slots, size, size), dtype=np.uint8)
+        self.slots: OrderedDict = OrderedDict()  # (heading bin, speed bin) -> slot, least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def params(self) -> tuple:
+        '''The parameters the kernels are built from'''
+        return (KERNEL_VERSION, self.density, self.maxcost, self.plotsize, self.sigmaFront, self.sigmaSide,
+                self.sigmaBack, self.headingBins, self.speedStep, self.speedBins, self.forecastDecay)
+
+    @property
+    def size(self) -> int:
+        return self.kernels.shape[1]
+
+    def key(self, theta: float, speed: float = 0.0) -> tuple:
+        heading = int(np.round(theta/self.headingStep)) % self.headingBins
+        speed = min(int(np.round(speed/self.speedStep)), self.speedBins - 1)
+        return heading, speed
+
+    def forecastKey(self, key: tuple, level: int) -> tuple:
+        '''Key of the kernel of the person of key level forecast steps ahead, stored after the speed bins'''
+        return key[0], key[1] + level*self.speedBins
+
+    def oSpaceKey(self, radius: float) -> tuple:
+        '''Key of the kernel of an O-space of radius [m], a disk of maxcost'''
+        return OSPACE_HEADING, min(int(np.round(radius/OSPACE_STEP)), int(self.plotsize/OSPACE_STEP))
+
+    def warm(self, speed: float = 0.0):
+        '''Builds the kernels of all headings of the speed bin of speed at once'''
+        speedBin = self.key(0.0, speed)[1]
+        headings = [heading for heading in range(self.headingBins) if (heading, speedBin) not in self.slots]
+        for start in range(0, min(len(headings), len(self.kernels)), 32):
+            batch = headings[start:start + 32]
+            zones = makeProxemicZones(
+                self.grid, self.grid, np.array(batch)*self.headingStep,
+                np.full(len(batch), self.sigmaFront + speedBin*self.speedStep),
+                self.maxcost, self.sigmaSide, self.sigmaBack)
+            for heading, zone in zip(batch, zones):
+                self.kernels[self.slot((heading, speedBin))] = zone
+
+    def slotsOf(self, keys: List[tuple]) -> np.ndarray:
+        '''
+        Returns the slots of the kernels of keys, building the missing ones
+
+        Kernels used in the same call are the most recently used, so none of them is evicted
+        as long as there are not more distinct keys than slots.
+        '''
+        if len(set(keys)) > len(self.kernels):
+            raise ValueError(f"{len(set(keys))} different kernels do not fit into {len(self.kernels)} slots")
+        slots = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            self.getKey(key)
+            slots[i] = self.slots[key]
+        return slots
+
+    def cachePath(self, directory: str) -> str:
+        digest = hashlib.sha1(repr(self.params).encode()).hexdigest()[:16]
+        return os.path.join(directory, f"social_zones_{digest}.npz")
+
+    def save(self, directory: str, keep: int = CACHE_FILES):
+        '''
+        Writes the built kernels to a compressed .npz file in directory named by the hash of the parameters
+        and deletes all but the keep most recently used banks, so changing the parameters does not fill it up
+        '''
+        os.makedirs(directory, exist_ok=True)
+        keys = list(self.slots)
+        path = self.cachePath(directory)
+        # write to a temporary file first so concurrent nodes never read a partial file
+        temporary = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(temporary, keys=np.array(keys, dtype=np.int32).reshape(-1, 2),
+                            kernels=self.kernels[[self.slots[key] for key in keys]])
+        os.replace(temporary, path)
+        pruneCache(directory, keep)
+
+    def load(self, directory: str) -> bool:
+        '''Loads the kernels saved with the same parameters, returns False when there are none'''
+        path = self.cachePath(directory)
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as cache:
+                keys, kernels = cache['keys'], cache['kernels']
+                if kernels.shape[1:] != self.kernels.shape[1:]:
+                    return False
+                for key, kernel in zip(keys[:len(self.kernels)], kernels):
+                    self.kernels[self.slot((int(key[0]), int(key[1])))] = kernel
+            # the modification time orders the banks by their last use for pruneCache
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            return False
+        return True
+
+    def slot(self, key: tuple) -> int:
+        '''Assigns a slot to key, evicting the least recently used kernel when the bank is full'''
+        if len(self.slots) < len(self.kernels):
+            slot = len(self.slots)
+        else:
+            slot = self.slots.popitem(last=False)[1]
+        self.slots[key] = slot
+        return slot
+
+    def get(self, theta: float, speed: float = 0.0) -> np.ndarray:
+        '''Returns the kernel of a person facing theta [rad] moving with speed [m/s]'''
+        return self.getKey(self.key(theta, speed))
+
+    def getKey(self, key: tuple) -> np.ndarray:
+        '''Returns the kernel of a (heading bin, speed bin) or O-space key'''
+        slot = self.slots.get(key)
+        if slot is not None:
+            self.slots.move_to_end(key)
+            self.hits += 1
+            return self.kernels[slot]
+        self.misses += 1
+        slot = self.slot(key)
+        if key[0] == OSPACE_HEADING:
+            self.kernels[slot] = np.where(np.hypot(*np.meshgrid(self.grid, self.grid)) <= key[1]*OSPACE_STEP,
+                                          self.maxcost, 0).astype(np.uint8)
+            return self.kernels[slot]
+        level, speedBin = divmod(key[1], self.speedBins)
+        self.kernels[slot] = makeProxemicZones(
+            self.grid, self.grid, [key[0]*self.headingStep], [self.sigmaFront + speedBin*self.speedStep],
+            self.maxcost*self.forecastDecay**level, self.sigmaSide, self.sigmaBack)[0]
+        return self.kernels[slot]
+
+
+def pruneCache(directory: str, keep: int = CACHE_FILES):
+    '''Deletes all but the keep most recently used kernel banks in directory'''
+    paths = [os.path.join(directory, name) for name in os.listdir(directory)
+             if name.startswith('social_zones_') and name.endswith('.npz') and '.tmp.' not in name]
+    try:
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[keep:]:
+            os.remove(path)
+    except OSError:
+        # another node pruned at the same time
+        pass
+
+
+def cachedKernelBank(*args, cacheDir: str = CACHE_DIR, **kwargs) -> KernelBank:
+    '''
+    Creates a KernelBank with the standing kernels of all headings, loaded from cacheDir when they were
+    built with the same parameters before and built and saved there otherwise
+    '''
+    bank = KernelBank(*args, **kwargs)
+    if not bank.load(cacheDir):
+        bank.warm(0.0)
+        try:
+            bank.save(cacheDir)
+        except OSError as e:
+            print(f"Could not save the social zone kernels to {cacheDir}: {e}")
+    return bank
+
+
+def worldCell(x, y, density: float) -> tuple:
+    '''World cells (row, col) of the positions x, y [m], rows grow against y like in the image'''
+    return -np.floor(np.asarray(y) / density).astype(int), np.floor(np.asarray(x) / density).astype(int)
+
+
+def peopleFootprints(people: np.ndarray, bank: KernelBank, density: float, minWalkingSpeed: float = 0.2,
+                     forecastHorizon: float = 0.0, forecastSteps: int = 0) -> tuple:
+    '''
+    Footprints [(row, col, kernel key)] of people (N, 6) x, y, theta, xdot, ydot, thetadot
+
+    Walking people are oriented along their velocity and, with a forecastHorizon [s], also stamped
+    at forecastSteps positions extrapolated with constant velocity up to the horizon, with the
+    kernels of the following forecast levels.
+
+    Return
+    ----------
+    footprints: the footprints of the people followed by the ones of the forecasts
+    headings: (N,) heading of every person [rad]
+    speeds: (N,) speed of every person [m/s]
+    '''
+    speeds = np.hypot(people[:, 3], people[:, 4])
+    headings = np.where(speeds > minWalkingSpeed, np.arctan2(people[:, 4], people[:, 3]), people[:, 2])
+    keys = [bank.key(heading, speed) for heading, speed in zip(headings, speeds)]
+    rows, cols = worldCell(people[:, 0], people[:, 1], density)
+    footprints = list(zip(rows.tolist(), cols.tolist(), keys))
+    if forecastHorizon > 0 and forecastSteps > 0:
+        walking = np.flatnonzero(speeds > minWalkingSpeed)
+        times = forecastHorizon*np.arange(1, forecastSteps + 1)/forecastSteps
+        rows, cols = worldCell(people[walking, 0, None] + people[walking, 3, None]*times,
+                               people[walking, 1, None] + people[walking, 4, None]*times, density)
+        for person, personRows, personCols in zip(walking, rows.tolist(), cols.tolist()):
+            footprints += [(row, col, bank.forecastKey(keys[person], level))
+                           for level, (row, col) in enumerate(zip(personRows, personCols), 1)]
+    return footprints, headings, speeds
+
+
+def stampKernel(canvas: np.ndarray, kernel: np.ndarray, row: int, col: int):
+    '''
+    Composites kernel into canvas with its center on pixel (row, col) by taking the maximum,
+    parts outside of the canvas are clipped
+    '''
+    top = row - kernel.shape[0]//2
+    left = col - kernel.shape[1]//2
+    r0, r1 = max(top, 0), min(top + kernel.shape[0], canvas.shape[0])
+    c0, c1 = max(left, 0), min(left + kernel.shape[1], canvas.shape[1])
+    if r0 >= r1 or c0 >= c1:
+        return
+    roi = canvas[r0:r1, c0:c1]
+    np.maximum(roi, kernel[r0-top:r1-top, c0-left:c1-left], out=roi)
+
+
+# rows composited by one task of stampRect, a band reads consecutive rows of every kernel
+STAMP_BAND = 16
+
+
+@njit(parallel=True, cache=True)
+def stampRect(ring, kernels, rows, cols, slots, r0, r1, c0, c1, clear):
+    '''
+    Composites kernels[slots] centered on the world cells (rows, cols) into the world rectangle
+    [r0, r1) x [c0, c1) of the ring buffer ring by taking the maximum, in parallel over bands of rows
+
+    Kernels are clipped to the rectangle, which may wrap around the ring but must not be larger
+    than it. rows has to be sorted, a band only visits the footprints overlapping it, found by
+    binary search. With clear the rectangle is zeroed first.
+    '''
+    height, width = ring.shape
+    size = kernels.shape[1]
+    half = size // 2
+    for band in prange((r1 - r0 + STAMP_BAND - 1) // STAMP_BAND):
+        b0 = r0 + band*STAMP_BAND
+        b1 = min(b0 + STAMP_BAND, r1)
+        if clear:
+            for r in range(b0, b1):
+                ringRow = ring[r % height]
+                c = c0
+                while c < c1:
+                    ringCol = c % width
+                    run = min(c1 - c, width - ringCol)
+                    ringRow[ringCol:ringCol + run] = 0
+                    c += run
+        # kernels cover the rows [rows - half, rows - half + size)
+        first = np.searchsorted(rows, b0 - size + half + 1)
+        last = np.searchsorted(rows, b1 + half)
+        for p in range(first, last):
+            top = rows[p] - half
+            start = max(c0, cols[p] - half)
+            end = min(c1, cols[p] - half + size)
+            if start >= end:
+                continue
+            for r in range(max(b0, top), min(b1, top + size)):
+                ringRow = ring[r % height]
+                kernelRow = kernels[slots[p], r - top]
+                # contiguous runs of the row between the wraps of the ring, composited in place
+                c = start
+                while c < end:
+                    ringCol = c % width
+                    run = min(end - c, width - ringCol)
+                    view = ringRow[ringCol:ringCol + run]
+                    np.maximum(view, kernelRow[c - cols[p] + half:c - cols[p] + half + run], view)
+                    c += run
+
+
+def splitRange(start: int, end: int, n: int):
+    '''Splits the range [start, end) of at most n cells into the parts that do not wrap around a ring of n'''
+    wrap = start + n - start % n
+    if end <= wrap:
+        return [(start, end)]
+    return [(start, wrap), (wrap, end)]
+
+
+def exposedRects(old: tuple, new: tuple) -> List[tuple]:
+    '''
+    Returns the world rectangles of the window new that were not part of the window old of the
+    same size, the whole window when they do not overlap
+    '''
+    if abs(new[0] - old[0]) >= old[1] - old[0] or abs(new[2] - old[2]) >= old[3] - old[2]:
+        return [new]
+    # rows and columns of the new window that were not part of the old one
+    rows = (old[1], new[1]) if new[0] > old[0] else (new[0], old[0])
+    cols = (old[3], new[3]) if new[2] > old[2] else (new[2], old[2])
+    return [rect for rect in ((rows[0], rows[1], new[2], new[3]), (new[0], new[1], cols[0], cols[1]))
+            if rect[0] < rect[1] and rect[2] < rect[3]]
+
+
+class SocialCanvas(object):
+    '''
+    Rolling window social map anchored in a world frame that is only recomposed where it changed
+
+    Cells are world grid cells (row, col) = (-floor(y/density), floor(x/density)) and are stored
+    in a preallocated ring buffer at (row mod rows, col mod cols), so moving the window with
+    moveTo() only clears and restamps the strips that became visible. The window is unrolled
+    into the preallocated map, whose top left cell is the origin of the window.
+
+    A stamp is identified by its footprint (row, col, kernel key) in world cells, so a person
+    that did not move or turn into another bin keeps its footprint and costs nothing, also
+    while the robot drives. Rectangles of removed stamps are cleared and every remaining stamp
+    overlapping them is stamped again, added stamps are composited on top. As the zones are
+    combined by their maximum the result equals a full redraw.
+
+    Parameters
+    ----------
+    shape: rows and columns of the window
+    bank: KernelBank the kernels are taken from
+    dtype: type of the map
+    redrawFraction: share of the window above which the dirty rectangles are not worth tracking
+    '''
+
+    def __init__(self, shape: tuple, bank: KernelBank, dtype=np.float32, redrawFraction: float = 0.5):
+        self.ring = np.zeros(shape, dtype=dtype)
+        self.map = np.zeros(shape, dtype=dtype)
+        self.bank = bank
+        self.redrawFraction = redrawFraction
+        self.origin = (0, 0)  # world cell of the top left corner of the window
+        self.moved = False
+        self.stamps: Counter = Counter()
+
+    @property
+    def window(self) -> tuple:
+        return (self.origin[0], self.origin[0] + self.ring.shape[0],
+                self.origin[1], self.origin[1] + self.ring.shape[1])
+
+    def clip(self, rect: tuple) -> tuple:
+        '''Returns the part of the world rectangle (r0, r1, c0, c1) inside the window, None when it is outside'''
+        w = self.window
+        r0, r1 = max(rect[0], w[0]), min(rect[1], w[1])
+        c0, c1 = max(rect[2], w[2]), min(rect[3], w[3])
+        return (r0, r1, c0, c1) if r0 < r1 and c0 < c1 else None
+
+    def rect(self, footprint: tuple) -> tuple:
+        '''Returns the world rectangle of the window covered by footprint, None when it is outside'''
+        row, col, key = footprint
+        top, left = row - self.bank.size//2, col - self.bank.size//2
+        return self.clip((top, top + self.bank.size, left, left + self.bank.size))
+
+    def pieces(self, rect: tuple, ring: np.ndarray = None):
+        '''
+        Yields the world rectangles rect is split into by the ring buffer with their views of ring,
+        a buffer of the same shape and cells, the one of the canvas by default
+        '''
+        ring = self.ring if ring is None else ring
+        rows, cols = ring.shape
+        for r0, r1 in splitRange(rect[0], rect[1], rows):
+            for c0, c1 in splitRange(rect[2], rect[3], cols):
+                yield (r0, r1, c0, c1), ring[r0 % rows:r0 % rows + r1 - r0, c0 % cols:c0 % cols + c1 - c0]
+
+    def stampAll(self, footprints: List[tuple], rect: tuple, clear: bool = False):
+        '''Stamps all footprints clipped to the world rectangle rect in one compiled pass'''
+        rows = np.array([footprint[0] for footprint in footprints], dtype=np.int64)
+        cols = np.array([footprint[1] for footprint in footprints], dtype=np.int64)
+        # only the footprints overlapping rect are looked up in the bank
+        top, left = rows - self.bank.size//2, cols - self.bank.size//2
+        overlapping = np.flatnonzero((top < rect[1]) & (rect[0] < top + self.bank.size) &
+                                     (left < rect[3]) & (rect[2] < left + self.bank.size))
+        # sorted by row for the bands of stampRect
+        overlapping = overlapping[np.argsort(rows[overlapping], kind='stable')]
+        footprints = [footprints[i] for i in overlapping]
+        rows, cols = rows[overlapping], cols[overlapping]
+        slots = self.bank.slotsOf([footprint[2] for footprint in footprints])
+        stampRect(self.ring, self.bank.kernels, rows, cols, slots, rect[0], rect[1], rect[2], rect[3], clear)
+
+    def warm(self):
+        '''
+        Compiles stampRect for the types of the canvas, or loads it from the numba cache, and starts
+        its threads, which would otherwise delay the first map by up to seconds
+        '''
+        self.stampAll([], (self.origin[0], self.origin[0] + 1, self.origin[1], self.origin[1] + 1))
+
+    def restamp(self, rect: tuple):
+        '''Clears rect and stamps every footprint overlapping it again'''
+        self.stampAll(list(self.stamps), rect, clear=True)
+
+    def unroll(self, rect: tuple):
+        '''Copies the world rectangle rect from the ring buffer into the map'''
+        for (r0, r1, c0, c1), view in self.pieces(rect):
+            self.map[r0 - self.origin[0]:r1 - self.origin[0], c0 - self.origin[1]:c1 - self.origin[1]] = view
+
+    def redraw(self, footprints: List[tuple]):
+        self.stamps = Counter(footprints)
+        self.restamp(self.window)
+        self.unroll(self.window)
+
+    def setBank(self, bank: KernelBank):
+        '''Redraws the window with the kernels of bank, the keys of the stamps stay the same'''
+        self.bank = bank
+        self.restamp(self.window)
+        self.moved = True
+
+    def moveTo(self, row: int, col: int):
+        '''Moves the top left corner of the window to the world cell (row, col)'''
+        if (row, col) == self.origin:
+            return
+        old = self.window
+        self.origin = (row, col)
+        self.moved = True
+        for rect in exposedRects(old, self.window):
+            self.restamp(rect)
+
+    def update(self, footprints: List[tuple]) -> tuple:
+        '''
+        Composes the window of footprints [(row, col, kernel key)] and returns the changed (r0, r1, c0, c1)
+        rectangle of the map, None when nothing changed
+        '''
+        stamps = Counter(footprints)
+        removed = [rect for rect in map(self.rect, self.stamps - stamps) if rect]
+        added = [(footprint, rect) for footprint, rect in
+                 ((footprint, self.rect(footprint)) for footprint in stamps - self.stamps) if rect]
+        self.stamps = stamps
+        rects = removed + [rect for footprint, rect in added]
+        moved, self.moved = self.moved, False
+        if not rects and not moved:
+            return None
+        dirty = self.window
+        if rects:
+            dirty = (min(r[0] for r in rects), max(r[1] for r in rects),
+                     min(r[2] for r in rects), max(r[3] for r in rects))
+        if (dirty[1] - dirty[0])*(dirty[3] - dirty[2]) > self.redrawFraction*self.ring.size:
+            self.restamp(self.window)
+        else:
+            for rect in removed:
+                self.restamp(rect)
+            if added:
+                self.stampAll([footprint for footprint, rect in added], self.window)
+        if moved:
+            dirty = self.window
+        self.unroll(dirty)
+        return (dirty[0] - self.origin[0], dirty[1] - self.origin[0],
+                dirty[2] - self.origin[1], dirty[3] - self.origin[1])
+
+
+class DecayingLayer(object):
+    '''
+    Memory of a SocialCanvas, the maximum of its past maps decayed exponentially by their age
+
+    The layer is a float32 ring buffer of the same world cells as the canvas, so every update
+    costs one multiply and one maximum over the window in place, whatever the number of people.
+    Cells that entered the window since the last update are cleared, they remember other cells.
+
+    Parameters
+    ----------
+    canvas: SocialCanvas that is remembered
+    halfLife: time after which a cost dropped to half [s]
+    '''
+
+    def __init__(self, canvas: SocialCanvas, halfLife: float):
+        self.canvas = canvas
+        self.halfLife = halfLife
+        self.ring = np.zeros(canvas.ring.shape, dtype=np.float32)
+        self.map = np.zeros(canvas.map.shape, dtype=canvas.map.dtype)
+        self.window = canvas.window
+        self.time = None
+
+    def update(self, time: float) -> np.ndarray:
+        '''Decays the layer to time [s], adds the current map of the canvas and returns the layer as map'''
+        for rect in exposedRects(self.window, self.canvas.window):
+            for piece, view in self.canvas.pieces(rect, self.ring):
+                view.fill(0)
+        self.window = self.canvas.window
+        if self.time is not None and time > self.time:
+            np.multiply(self.ring, np.float32(0.5**((time - self.time)/self.halfLife)), out=self.ring)
+        self.time = time if self.time is None else max(self.time, time)
+        np.maximum(self.ring, self.canvas.ring, out=self.ring)
+        origin = self.canvas.origin
+        for (r0, r1, c0, c1), view in self.canvas.pieces(self.window, self.ring):
+            self.map[r0 - origin[0]:r1 - origin[0], c0 - origin[1]:c1 - origin[1]] = view
+        return self.map
+
+
+class SocialPyramid(object):
+    '''
+    Resolution pyramid of a social map in preallocated arrays
+
+    Level 0 is the fine center of the map at full resolution, a view without copy, and level k the
+    whole map with cells 2**k times larger. Every level is the maximum of the 2 x 2 blocks of the one
+    before, so the map is only read once and a cost is never lost to a coarser level. Blocks on the
+    border that are cut by the map take the maximum of their part.
+
+    Parameters
+    ----------
+    socialMap: the map the levels are taken from, updated in place
+    levels: number of coarse levels
+    fineShape: rows and columns of level 0
+    '''
+
+    def __init__(self, socialMap: np.ndarray, levels: int, fineShape: tuple):
+        self.socialMap = socialMap
+        rows, cols = socialMap.shape
+        fineRows, fineCols = min(fineShape[0], rows), min(fineShape[1], cols)
+        # top left cell of level 0 in the map
+        self.fineOffset = ((rows - fineRows)//2, (cols - fineCols)//2)
+        self.levels = [socialMap[self.fineOffset[0]:self.fineOffset[0] + fineRows,
+                                 self.fineOffset[1]:self.fineOffset[1] + fineCols]]
+        self.halves = []  # maps with halved rows only, between two levels
+        previous = socialMap
+        for level in range(levels):
+            rows, cols = -(-rows//2), -(-cols//2)
+            self.halves.append(np.zeros((rows, previous.shape[1]), dtype=socialMap.dtype))
+            previous = np.zeros((rows, cols), dtype=socialMap.dtype)
+            self.levels.append(previous)
+
+    def update(self) -> List[np.ndarray]:
+        '''Downsamples the current map into the coarse levels and returns all levels'''
+        previous = self.socialMap
+        for half, level in zip(self.halves, self.levels[1:]):
+            rows = previous.shape[0]//2
+            np.maximum(previous[0:2*rows:2], previous[1:2*rows:2], out=half[:rows])
+            if previous.shape[0] % 2:
+                half[rows] = previous[-1]
+            cols = half.shape[1]//2
+            np.maximum(half[:, 0:2*cols:2], half[:, 1:2*cols:2], out=level[:, :cols])
+            if half.shape[1] % 2:
+                level[:, cols] = half[:, -1]
+            previous = level
+        return self.levels
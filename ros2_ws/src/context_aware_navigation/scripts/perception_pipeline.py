@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+import rclpy
+import sys
+import threading
+from rclpy.executors import MultiThreadedExecutor
+
+from multi_person_tracker.multi_person_tracker import MultiPersonTracker
+from multi_person_tracker.scheduling import LatestSlot
+from multi_person_tracker.tracing import stampToNs
+from context_aware_navigation.social_map import SocialMapGenerator
+from interaction_detection.detectContextNode import Detector
+
+
+class PerceptionPipeline(object):
+    '''
+    Runs the tracker, the social map generator and the interaction detector in one process
+
+    The track snapshots of the tracker and the social maps are handed to the next stage as
+    numpy arrays through latest-wins slots, so no stage waits on serialization. The people,
+    social_map and interaction_bb topics are still published for external consumers, the
+    social map by its own thread off the critical path.
+    With PERCEPTION_TRACING=1 the latency and cpu reports printed on shutdown can be compared
+    to the ones of the separate tracker, social_map_generator.py and interaction_detection processes.
+
+    Parameters
+    ----------
+    maxcost: default of the maxcost parameter, cost at the center of a social zone
+    '''
+
+    def __init__(self, maxcost):
+        self.tracker = MultiPersonTracker(publishKeypoints=False,
+                                          dt=0.02, target_frame="camera_link", transformMaxAge=1.0,
+                                          debug=False)
+        self.socialMapGenerator = SocialMapGenerator(15, 15, 0.05, maxcost, subscribe=False)
+        self.detector = Detector(subscribe=False)
+        self.nodes = [self.tracker, self.socialMapGenerator, self.detector]
+
+        self.tracks = LatestSlot()
+        self.maps = LatestSlot()
+        self.mapsToPublish = LatestSlot()
+        self.tracker.addTrackSink(lambda header, people: self.tracks.put((header, people)))
+        self.threads = [threading.Thread(target=stage, daemon=True)
+                        for stage in (self.mapStage, self.detectStage, self.publishStage)]
+        for thread in self.threads:
+            thread.start()
+
+    def mapStage(self):
+        while True:
+            item = self.tracks.take()
+            if item is None:
+                return
+            header, people = item
+            socialMap = self.socialMapGenerator.generate(people, header.frame_id, header.stamp)
+            if socialMap is None:
+                continue
+            self.socialMapGenerator.tracer.mark('social_map', stampToNs(header.stamp),
+                                                people=len(people))
+            # the generator recomposes its map in place, the next stages get their own copy
+            socialMap = socialMap.copy()
+            memory = self.socialMapGenerator.memory
+            pyramid = self.socialMapGenerator.pyramid
+            self.maps.put((header.stamp, socialMap))
+            self.mapsToPublish.put((header.stamp, socialMap, self.socialMapGenerator.canvas.origin,
+                                    None if memory is None else memory.map.copy(),
+                                    None if pyramid is None else [level.copy() for level in pyramid.levels]))
+
+    def detectStage(self):
+        while True:
+            item = self.maps.take()
+            if item is None:
+                return
+            stamp, socialMap = item
+            boundingBoxes = self.detector.detectMap(socialMap, "base_link", stamp)
+            if boundingBoxes is None:
+                continue
+            self.detector.interaction_publisher.publish(boundingBoxes)
+            self.detector.tracer.mark('interaction_boxes', stampToNs(stamp),
+                                      boxes=len(boundingBoxes.boundingboxes))
+
+    def publishStage(self):
+        while True:
+            item = self.mapsToPublish.take()
+            if item is None:
+                return
+            stamp, socialMap, origin, persistentMap, levels = item
+            self.socialMapGenerator.publishMap(socialMap, stamp, origin)
+            if persistentMap is not None:
+                self.socialMapGenerator.publishMap(persistentMap, stamp, origin,
+                                                   self.socialMapGenerator.persistent_publisher)
+            if levels is not None:
+                self.socialMapGenerator.publishPyramid(levels, stamp, origin)
+
+    def stop(self):
+        for slot in (self.tracks, self.maps, self.mapsToPublish):
+            slot.close()
+        for thread in self.threads:
+            thread.join()
+        for node in (self.socialMapGenerator, self.detector):
+            if node.tracer.enabled:
+                # the cpu of the whole process is reported by the tracker
+                print(node.tracer.report(withCpu=False))
+                node.tracer.dump()
+        print(self.detector.cache.report())
+        for slot, name in ((self.tracks, 'tracks'), (self.maps, 'social maps')):
+            print(f"{name}: {slot.dropped} of {slot.received} overwritten before they were taken")
+        for node in self.nodes:
+            node.destroy_node()
+
+
+def main(args=sys.argv):
+    rclpy.init(args=args)
+
+    # the cost can still be given as the first argument, it is the default of the maxcost parameter
+    args = rclpy.utilities.remove_ros_args(args)
+    pipeline = PerceptionPipeline(int(args[1]) if len(args) > 1 else 253)
+    executor = MultiThreadedExecutor()
+    for node in pipeline.nodes:
+        executor.add_node(node)
+    try:
+        executor.spin()
+    except KeyboardInterrupt:
+        pass
+    pipeline.stop()
+    rclpy.shutdown()
+
+
+if __name__ == '__main__':
+    main(args=sys.argv)
@@ -128,7 +128,14 @@ namespace context_aware_navigation
                 return;
             }
 
-            cv_ptr->image.convertTo(social_map, CV_8UC1);   //make sure this is uint8
+            if (cv_ptr->image.type() == CV_8UC1)            //mono8 maps need no conversion
+            {
+                social_map = cv_ptr->image;
+            }
+            else
+            {
+                cv_ptr->image.convertTo(social_map, CV_8UC1);   //make sure this is uint8
+            }
             cv::flip(social_map,social_map,0);              //flip since image coordinate frame is downwards positive
             social_map.copyTo(social_map);                  //safe a copy of this to prevent segfault
         }
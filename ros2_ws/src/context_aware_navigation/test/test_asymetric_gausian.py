@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from context_aware_navigation.asymetricGausian import makeProxemicZones
+
+rotate = pytest.importorskip('scipy.ndimage').rotate
+
+# odd number of cells, so the person is on the center of the rotation
+GRID = np.arange(-80, 81)*0.05  # [m]
+
+
+def direction(zone):
+    '''Direction of the cost mass of zone as displayed, counterclockwise from the columns [deg]'''
+    rows, cols = np.nonzero(zone)
+    center = (len(zone) - 1)/2
+    weights = zone[rows, cols].astype(float)
+    return np.degrees(np.arctan2(-np.sum(weights*(rows - center)), np.sum(weights*(cols - center))))
+
+
+@pytest.mark.parametrize('theta', [0.3, 1.0, 2.0, 2.8, -0.5, -2.2])
+def test_oriented_zone_matches_rotated_zone(theta):
+    # the generator used to rotate the zone of theta 0 by theta with scipy
+    rotated = rotate(makeProxemicZones(GRID, GRID, [0.0], [2.0], 253)[0], np.degrees(theta), reshape=True)
+    start = (len(rotated) - len(GRID))//2
+    reference = rotated[start:start + len(GRID), start:start + len(GRID)]
+    zone = makeProxemicZones(GRID, GRID, [theta], [2.0], 253)[0]
+
+    for angle in (direction(rotated), np.degrees(theta)):
+        assert abs(np.angle(np.exp(1j*np.radians(direction(zone) - angle)), deg=True)) < 1
+    overlap = np.sum((zone > 0) & (reference > 0))/np.sum((zone > 0) | (reference > 0))
+    assert overlap > 0.85
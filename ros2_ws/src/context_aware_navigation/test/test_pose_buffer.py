@@ -0,0 +1,30 @@
+import numpy as np
+
+from context_aware_navigation.pose_buffer import PoseBuffer, se2Compose, se2Interpolate, transformPeople
+
+
+def test_interpolates_on_the_arc():
+    # a quarter circle of radius 1 around (0, 1)
+    a, b = np.array([0.0, 0.0, 0.0]), np.array([1.0, 1.0, np.pi/2])
+    x, y, yaw = se2Interpolate(a, b, 0.5)
+    assert np.isclose(np.hypot(x, y - 1), 1)
+    assert np.isclose(yaw, np.pi/4)
+
+
+def test_stale_poses_are_not_used():
+    poses = PoseBuffer(maxExtrapolation=0.1, maxAge=0.5)
+    assert poses.at(0.0) is None
+    poses.add(0.0, 0.0, 0.0, 0.0)
+    poses.add(1.0, 1.0, 0.0, 0.0)
+    assert np.allclose(poses.at(0.5), [0.5, 0, 0])
+    # extrapolated for maxExtrapolation, then held until maxAge
+    assert np.allclose(poses.at(1.3), [1.1, 0, 0])
+    assert poses.latest == 1.0
+    assert poses.at(1.6) is None
+
+
+def test_people_are_moved_with_the_yaw():
+    # robot at (2, 3) facing y, its camera 0.5m ahead, a person 1m ahead of the camera walking to its left
+    people = np.array([[1.0, 0.0, 0.0, 0.0, 1.0, 0.0]])
+    moved = transformPeople(people, se2Compose(np.array([2.0, 3.0, np.pi/2]), np.array([0.5, 0.0, 0.0])))
+    assert np.allclose(moved, [[2.0, 4.5, np.pi/2, -1.0, 0.0, 0.0]])
@@ -0,0 +1,43 @@
+import pytest
+
+import numpy as np
+
+from context_aware_navigation.benchmark import benchmarkGeneration, kernelDirection, main, orientationError, \
+    ORIENTATION_TOLERANCE
+from context_aware_navigation.social_zones import KernelBank, peopleFootprints, SocialCanvas
+
+
+@pytest.mark.parametrize('forecastSteps', [0, 2])
+def test_generation_equals_reference(forecastSteps):
+    results = benchmarkGeneration(crowds=(0, 5, 30), densities=(0.1,), sizes=(6, 10), frames=20,
+                                  forecastSteps=forecastSteps, verbose=False)
+    assert len(results) == 6
+    for result in results:
+        assert result['mismatches'] == 0, result
+        assert result['orientationError'] <= np.degrees(ORIENTATION_TOLERANCE), result
+        assert result['p50'] <= result['p95'] <= result['p99'] <= result['max']
+
+
+def test_generation_command_line(tmp_path):
+    output = tmp_path / 'results.json'
+    main(['generation', '--crowds', '10', '--densities', '0.1', '--sizes', '6', '--frames', '5',
+          '--json', str(output)])
+    assert output.exists()
+
+
+@pytest.mark.parametrize('density', [0.05, 0.1])
+def test_kernels_point_along_heading(density):
+    assert orientationError(KernelBank(density, 253)) <= ORIENTATION_TOLERANCE
+
+
+@pytest.mark.parametrize('velocity', [(1.0, 0.0), (0.0, 1.0), (-0.7, 0.7), (0.5, -1.2)])
+def test_walking_person_is_stamped_along_velocity(velocity):
+    # a person walking through the middle of the map, the zone has to reach further ahead than behind
+    density = 0.05
+    bank = KernelBank(density, 253)
+    people = np.array([[0.0, 0.0, 0.0, *velocity, 0.0]])
+    canvas = SocialCanvas((200, 200), bank, dtype=np.uint8)
+    canvas.moveTo(-100, -100)
+    canvas.update(peopleFootprints(people, bank, density)[0])
+    direction = kernelDirection(canvas.map)
+    assert abs(np.angle(np.exp(1j*(direction - np.arctan2(velocity[1], velocity[0]))))) <= ORIENTATION_TOLERANCE
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from .models.common import Conv
+from .models.experimental import attempt_load, End2End
+from .utils.activations import SiLU
+from .utils.general import check_img_size, non_max_suppression
+from .utils.torch_utils import select_device, TracedModel
+
+BACKENDS = ('torch', 'onnxruntime')
+# class offset of the boxes in the exported NMS, the same as the max_wh of non_max_suppression
+NMS_MAX_WH = 4096
+
+
+class TorchBackend(object):
+    '''
+    Runs the PyTorch weights, optionally traced, and non_max_suppression on them
+
+    Parameters
+    ----------
+    weights: the trained weights for detecting interaction
+    img_size: the width of the image for input
+    device: choose compute device
+    trace: choose whether the model is traced
+    augment: choose if the images are augmented
+    conf_thres: choose the confidence threshold for detection output
+    iou_thres: choose the intersection over union threshold for NMS
+    classes: only keep the detections of these classes, all when None
+    agnostic_nms: choose if the classes affect the IOU NMS
+    '''
+
+    def __init__(self, weights, img_size=320, device='', trace=True, augment=False,
+                 conf_thres=0.25, iou_thres=0.45, classes=None, agnostic_nms=False):
+        self.augment, self.conf_thres, self.iou_thres = augment, conf_thres, iou_thres
+        self.classes, self.agnostic_nms = classes, agnostic_nms
+        self.device = select_device(device)
+        self.half = self.device.type != 'cpu'  # half precision only supported on CUDA
+
+        self.model = attempt_load(weights, map_location=self.device)  # load FP32 model
+        self.stride = int(self.model.stride.max())  # model stride
+        self.imgsz = check_img_size(img_size, s=self.stride)  # check img_size
+        self.names = self.model.module.names if hasattr(self.model, 'module') else self.model.names
+        if trace:
+            self.model = TracedModel(self.model, self.device, self.imgsz)
+        if self.half:
+            self.model.half()  # to FP16
+
+        # Warmup, the input is always letterboxed to imgsz so it runs once
+        if self.device.type != 'cpu':
+            for i in range(3):
+                self.model(torch.zeros(1, 3, self.imgsz, self.imgsz).to(
+                    self.device).type_as(next(self.model.parameters())), augment=self.augment)
+
+    def predict(self, img: np.ndarray) -> torch.Tensor:
+        '''Returns the (n, 6) detections xyxy, conf, cls of the letterboxed (3, H, W) uint8 image img in its pixels'''
+        img = torch.from_numpy(img).to(self.device)
+        img = img.half() if self.half else img.float()  # uint8 to fp16/32
+        img /= 255.0  # 0 - 255 to 0.0 - 1.0
+        with torch.no_grad():   # Calculating gradients would cause a GPU memory leak
+            pred = self.model(img.unsqueeze(0), augment=self.augment)[0]
+        return non_max_suppression(
+            pred, self.conf_thres, self.iou_thres, classes=self.classes, agnostic=self.agnostic_nms)[0]
+
+
+class OnnxRuntimeBackend(object):
+    '''
+    Runs a model exported by exportOnnx with ONNX Runtime on the CPU, the NMS is part of the graph
+
+    The confidence and IOU thresholds and whether the NMS is class agnostic are fixed at export,
+    only the class filter is applied here. The input size, stride and class names are read from
+    the metadata of the model.
+
+    Parameters
+    ----------
+    model: the exported .onnx model
+    classes: only keep the detections of these classes, all when None
+    threads: intra op threads of ONNX Runtime, 0 for its default
+    '''
+
+    def __init__(self, model, classes=None, threads=0):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            str(model), sess_options=options, providers=['CPUExecutionProvider'])
+        self.input = self.session.get_inputs()[0].name
+        self.imgsz = int(self.session.get_inputs()[0].shape[-1])
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.stride = int(metadata.get('stride', 32))
+        self.names = json.loads(metadata['names']) if 'names' in metadata else None
+        self.classes = classes
+
+    def predict(self, img: np.ndarray) -> torch.Tensor:
+        '''Returns the (n, 6) detections xyxy, conf, cls of the letterboxed (3, H, W) uint8 image img in its pixels'''
+        img = (img[None].astype(np.float32) / 255.0)  # uint8 to fp32, 0 - 255 to 0.0 - 1.0
+        # rows of batch, x0, y0, x1, y1, cls, score
+        out = self.session.run(None, {self.input: img})[0]
+        det = out[:, [1, 2, 3, 4, 6, 5]]
+        if self.classes is not None:
+            det = det[np.isin(det[:, 5], self.classes)]
+        # best first like non_max_suppression
+        return torch.from_numpy(np.ascontiguousarray(det[np.argsort(-det[:, 4], kind='stable')]))
+
+
+def makeBackend(backend, weights, onnx_model=None, img_size=320, device='', trace=True, augment=False,
+                conf_thres=0.25, iou_thres=0.45, classes=None, agnostic_nms=False):
+    '''
+    Builds the inference backend by name, the torch one from weights or the onnxruntime one
+    from onnx_model, which defaults to weights with the .onnx suffix
+    '''
+    if backend == 'torch':
+        return TorchBackend(weights, img_size, device, trace, augment, conf_thres, iou_thres, classes, agnostic_nms)
+    if backend == 'onnxruntime':
+        onnx_model = onnx_model or Path(weights).with_suffix('.onnx')
+        if not Path(onnx_model).exists():
+            raise FileNotFoundError(f'{onnx_model} not found, export it with interaction_detection_onnx export')
+        return OnnxRuntimeBackend(onnx_model, classes)
+    raise ValueError(f'unknown inference backend {backend}, choose one of {BACKENDS}')
+
+
+def exportOnnx(weights, output=None, img_size=320, conf_thres=0.25, iou_thres=0.45, agnostic_nms=False,
+               max_obj=100, opset=12):
+    '''
+    Exports the weights with the ONNX Runtime NMS of End2End for a fixed 1x3ximg_sizeximg_size input
+
+    Return
+    ----------
+    output: path of the .onnx model, weights with the .onnx suffix by default
+    '''
+    output = Path(output or Path(weights).with_suffix('.onnx'))
+    model = attempt_load(weights, map_location=torch.device('cpu'))
+    stride = int(model.stride.max())
+    img_size = check_img_size(img_size, s=stride)
+    names = model.module.names if hasattr(model, 'module') else model.names
+    for m in model.modules():
+        if isinstance(m, Conv) and isinstance(m.act, nn.SiLU):
+            m.act = SiLU()  # export friendly
+    img = torch.zeros(1, 3, img_size, img_size)
+    model(img)  # dry run, builds the grids
+
+    model = End2End(model, max_obj, iou_thres, conf_thres, 0 if agnostic_nms else NMS_MAX_WH,
+                    torch.device('cpu'), len(names))
+    torch.onnx.export(model, img, str(output), verbose=False, opset_version=opset,
+                      input_names=['images'], output_names=['output'])
+
+    try:
+        import onnx
+    except ImportError:
+        print('onnx is not installed, the stride and names are not stored in the model')
+        return output
+    graph = onnx.load(str(output))
+    for key, value in (('stride', str(stride)), ('names', json.dumps(list(names)))):
+        meta = graph.metadata_props.add()
+        meta.key, meta.value = key, value
+    onnx.save(graph, str(output))
+    return output
+
+
+def compareBackends(weights, onnx_model, images, img_size=320, conf_thres=0.25, iou_thres=0.45,
+                    runs=50, verbose=True):
+    '''
+    Runs both backends on the CPU on the letterboxed (3, H, W) uint8 images and compares
+    their latency and detections
+
+    Return
+    ----------
+    results: latency per backend [ms] and the largest box [px] and score difference of the matched detections
+    '''
+    backends = {'torch': TorchBackend(weights, img_size, 'cpu', trace=False,
+                                      conf_thres=conf_thres, iou_thres=iou_thres),
+                'onnxruntime': OnnxRuntimeBackend(onnx_model)}
+    results = {}
+    for name, backend in backends.items():
+        backend.predict(images[0])  # warmup
+        times = []
+        for i in range(runs):
+            start = time.perf_counter()
+            backend.predict(images[i % len(images)])
+            times.append(time.perf_counter() - start)
+        results[name] = {'p50': 1e3*float(np.percentile(times, 50)), 'p95': 1e3*float(np.percentile(times, 95))}
+
+    boxError = scoreError = 0.0
+    unmatched = 0
+    for img in images:
+        reference = backends['torch'].predict(img).numpy()
+        candidate = backends['onnxruntime'].predict(img).numpy()
+        for det in reference:
+            same = candidate[candidate[:, 5] == det[5]]
+            if not len(same):
+                unmatched += 1
+                continue
+            error = np.abs(same[:, :4] - det[:4]).max(axis=1)
+            best = int(error.argmin())
+            boxError = max(boxError, float(error[best]))
+            scoreError = max(scoreError, float(abs(same[best, 4] - det[4])))
+    results.update(boxError=boxError, scoreError=scoreError, unmatched=unmatched)
+    if verbose:
+        for name in backends:
+            print(f"{name:12s} p50 {results[name]['p50']:7.2f}ms  p95 {results[name]['p95']:7.2f}ms")
+        print(f"largest difference {boxError:.3f}px box, {scoreError:.4f} score, {unmatched} unmatched detections")
+    return results
+
+
+def randomMaps(count, img_size=320, seed=0):
+    '''Letterboxed (3, img_size, img_size) uint8 images of a few random social zones for comparing the backends'''
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[:img_size, :img_size]
+    images = []
+    for i in range(count):
+        im = np.zeros((img_size, img_size))
+        for cx, cy, sigma in zip(*rng.uniform(0.2*img_size, 0.8*img_size, (2, 6)), rng.uniform(5, 15, 6)):
+            im = np.maximum(im, 253*np.exp(-((x - cx)**2 + (y - cy)**2)/(2*sigma**2)))
+        images.append(np.ascontiguousarray(np.repeat(im.astype(np.uint8)[None], 3, axis=0)))
+    return images
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='ONNX Runtime backend of the interaction detector')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export = subparsers.add_parser('export', help='export the weights with embedded NMS')
+    compare = subparsers.add_parser('compare', help='compare the CPU latency and detections of both backends')
+    for sub in (export, compare):
+        sub.add_argument('--weights', required=True)
+        sub.add_argument('--img-size', type=int, default=320)
+        sub.add_argument('--conf-thres', type=float, default=0.25)
+        sub.add_argument('--iou-thres', type=float, default=0.45)
+    export.add_argument('--output', default=None, help='defaults to the weights with the .onnx suffix')
+    export.add_argument('--agnostic-nms', action='store_true')
+    export.add_argument('--max-obj', type=int, default=100)
+    export.add_argument('--opset', type=int, default=12)
+    compare.add_argument('--onnx', default=None, help='defaults to the weights with the .onnx suffix')
+    compare.add_argument('--images', type=int, default=20)
+    compare.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args(args)
+
+    if args.command == 'export':
+        output = exportOnnx(args.weights, args.output, args.img_size, args.conf_thres, args.iou_thres,
+                            args.agnostic_nms, args.max_obj, args.opset)
+        print(f'exported {output}')
+    else:
+        onnx_model = args.onnx or Path(args.weights).with_suffix('.onnx')
+        compareBackends(args.weights, onnx_model, randomMaps(args.images, args.img_size), args.img_size,
+                        args.conf_thres, args.iou_thres, args.runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,15 @@
 #!/usr/bin/env python3
+import re
+import time
 from pathlib import Path
 
 import torch
 import numpy as np
 import cv2
 
-from .models.experimental import attempt_load
+from .backends import makeBackend
 from .utils.datasets import letterbox
-from .utils.general import check_img_size, non_max_suppression, \
-    scale_coords, xyxy2xywh, set_logging
-from .utils.torch_utils import select_device, time_synchronized, TracedModel
+from .utils.general import scale_coords, xyxy2xywh, set_logging
 
 import rclpy
 from rclpy.node import Node
@@ -20,6 +20,53 @@ from multi_person_tracker_interfaces.msg import BoundingBoxes, BoundingBox
 from tf2_ros import TransformException
 from tf2_ros.buffer import Buffer
 from tf2_ros.transform_listener import TransformListener
+from multi_person_tracker.tracing import Tracer, stampToNs
+
+# size of a cell of social_map [m/px], the density of the social_map_generator
+MAP_RESOLUTION = 0.05
+
+class InferenceCache(object):
+    '''
+    Remembers the detections of the last social map, so maps that did not change are not run
+    through the model again
+
+    A map is fingerprinted by the hash of every 4th pixel of every 4th row, only when that
+    matches it is compared with the last map pixel by pixel. Empty maps have no detections.
+    '''
+
+    def __init__(self):
+        self.fingerprint = None
+        self.map = None
+        self.detections = []
+        self.hits = 0
+        self.emptyHits = 0
+        self.misses = 0
+        self.inferenceTime = 0.0  # [s] spent in the model on misses
+
+    def lookup(self, im0s: np.ndarray):
+        '''Returns the fingerprint of im0s and its detections, None as detections when it has to be run'''
+        fingerprint = hash((im0s.shape, im0s[::4, ::4].tobytes()))
+        if fingerprint == self.fingerprint and np.array_equal(im0s, self.map):
+            self.hits += 1
+            return fingerprint, self.detections
+        if not im0s.any():
+            self.emptyHits += 1
+            return fingerprint, []
+        self.misses += 1
+        return fingerprint, None
+
+    def store(self, fingerprint, im0s: np.ndarray, detections: list, seconds: float):
+        self.fingerprint = fingerprint
+        self.map = im0s.copy()
+        self.detections = detections
+        self.inferenceTime += seconds
+
+    def report(self) -> str:
+        total = self.hits + self.emptyHits + self.misses
+        mean = self.inferenceTime/self.misses if self.misses else 0.0
+        return (f"interaction detection cache: {self.hits} unchanged and {self.emptyHits} empty of {total} maps "
+                f"skipped inference, {1e3*mean:.1f}ms per inference, ~{mean*(self.hits + self.emptyHits):.1f}s saved")
+
 
 class Detector(Node):
     '''
@@ -36,98 +83,115 @@ class Detector(Node):
     classes: change the name of classes if different from the training
     agnostic_nms: choose if the classes affect the IOU NMS
     device: choose compute device
+    subscribe: detect on every social_map message, False when the maps are passed to detectMap()
+    topic: social map topic subscribed to, overridden by the topic parameter, the maps of social_map
+        are resized to img_size like in training, the ones of a pyramid level social_map_level{k} of
+        the generator with at most img_size pixels are only padded with zero cost
+    map_resolution: size of a cell of the social maps [m/px], overridden by the map_resolution parameter,
+        when None the one of the generator for topic, MAP_RESOLUTION on social_map and MAP_RESOLUTION*2**k
+        on social_map_level{k}, the side of a map in meters is its pixels times map_resolution
+    backend: inference backend, 'torch' or 'onnxruntime' for the CPU, overridden by the backend parameter
+    onnx_model: model exported with interaction_detection_onnx export for the onnxruntime backend,
+        the weights with the .onnx suffix when None, overridden by the onnx_model parameter
     '''
 
     def __init__(self, weights='/ros_ws/src/interaction_detection/interaction_detection/yolov7-ContextNav.pt',
-                 img_size=320, map_size=15,
+                 img_size=320, map_resolution=None,
                  trace=True, augment=False, conf_thres=0.25, iou_thres=0.45,
-                 classes=None, agnostic_nms=False, device=''):
+                 classes=None, agnostic_nms=False, device='', subscribe=True, topic='/social_map',
+                 backend='torch', onnx_model=None):
 
         super().__init__('context_aware_detector')
         self.weights, self.imgsz, self.trace = weights, img_size, trace
         self.augment, self.conf_thres, self.iou_thres = augment, conf_thres, iou_thres
         self.classes, self.agnostic_nms = classes, agnostic_nms
-        self.map_size = map_size
+        topic = self.declare_parameter('topic', topic).value
+        level = re.search(r'_level(\d+)$', topic)
+        # pyramid levels keep their cells, the full map is scaled like the training maps
+        self.padMaps = level is not None
+        if map_resolution is None:
+            map_resolution = MAP_RESOLUTION*2**int(level.group(1)) if level else MAP_RESOLUTION
+        self.map_resolution = self.declare_parameter('map_resolution', float(map_resolution)).value
 
         # Initialize
         set_logging()
-        self.device = select_device(device)
-        self.half = self.device.type != 'cpu'  # half precision only supported on CUDA
-
-        # Load model
-        self.model = attempt_load(
-            self.weights, map_location=self.device)  # load FP32 model
-        self.stride = int(self.model.stride.max())  # model stride
-        self.imgsz = check_img_size(
-            self.imgsz, s=self.stride)  # check img_size
 
-        if self.trace:
-            self.model = TracedModel(self.model, self.device, self.imgsz)
-
-        if self.half:
-            self.model.half()  # to FP16
-
-        # Get names and colors
-        self.names = self.model.module.names if hasattr(
-            self.model, 'module') else self.model.names
-
-        # Run inference
-        if self.device.type != 'cpu':
-            self.model(torch.zeros(1, 3, self.imgsz, self.imgsz).to(
-                self.device).type_as(next(self.model.parameters())))  # run once
-        self.old_img_w = self.old_img_h = self.imgsz
-        self.old_img_b = 1
+        # Load model, the thresholds of the onnxruntime backend are the ones it was exported with
+        backend = self.declare_parameter('backend', backend).value
+        onnx_model = self.declare_parameter('onnx_model', onnx_model or '').value or None
+        self.backend = makeBackend(backend, self.weights, onnx_model, self.imgsz, device, self.trace,
+                                   self.augment, self.conf_thres, self.iou_thres, self.classes,
+                                   self.agnostic_nms)
+        self.stride, self.imgsz, self.names = self.backend.stride, self.backend.imgsz, self.backend.names
+        self.get_logger().info(f'interaction detection with the {backend} backend')
+        # unchanged and empty maps reuse the last detections instead of running the model
+        self.cache = InferenceCache()
 
         # ROS2 subscriber and publisher setup
         self.interaction_publisher = self.create_publisher(
             BoundingBoxes, '/interaction_bb', 10)
 
         self.bridge = CvBridge()
-        self.subscription = self.create_subscription(
-            Image,
-            '/social_map',
-            self.social_zone_callback,
-            10)
-        self.subscription  # prevent unused variable warning
+        if subscribe:
+            self.subscription = self.create_subscription(
+                Image,
+                topic,
+                self.social_zone_callback,
+                10)
         # tf listener stuff so we can transform people into there
         self.tf_buffer = Buffer()
         self.tf_listener = TransformListener(self.tf_buffer, self)
+        # latency tracing from the social map stamp, enabled with PERCEPTION_TRACING=1
+        self.tracer = Tracer.fromEnvironment(
+            'interaction_detection', clock=lambda: self.get_clock().now().nanoseconds)
         print("DONE INITIALIZING INTERACTION DETECTOR")
 
     def social_zone_callback(self, msg):
+        try:
+            im0s = self.bridge.imgmsg_to_cv2(
+                msg, desired_encoding='passthrough')
+        except Exception as e:
+            print(f"Exception on social_zone_callback")
+            print(e)
+            return
+        boundingBoxes = self.detectMap(im0s, msg.header.frame_id, msg.header.stamp)
+        if boundingBoxes is None:
+            return
+        self.interaction_publisher.publish(boundingBoxes)
+        self.tracer.mark('interaction_boxes', stampToNs(msg.header.stamp),
+                         boxes=len(boundingBoxes.boundingboxes))
+
+    def detectMap(self, im0s, frame_id, stamp):
+        '''
+        Detects interactions in the social map im0s of frame_id at stamp and returns them as
+        BoundingBoxes in the map frame, None when the map could not be processed
+        '''
         try:
             t = self.tf_buffer.lookup_transform_full(
                 target_frame="map",
                 target_time=rclpy.time.Time(),
-                source_frame=msg.header.frame_id,
-                source_time=msg.header.stamp,
+                source_frame=frame_id,
+                source_time=stamp,
                 fixed_frame="map")
         except TransformException as ex:
             self.get_logger().info(
                 f'Could not transform base_link to map: {ex}')
-            return
+            return None
 
         try:
-
-            im0s = self.bridge.imgmsg_to_cv2(
-                msg, desired_encoding='passthrough')
-            # Convert image to rgb for YOLOv7
-            im0s = cv2.cvtColor(im0s, cv2.COLOR_GRAY2RGB)
-            self.timestamp = self.get_clock().now().nanoseconds
-
             assert im0s is not None, 'Image Not Found '
-            img = letterbox(im0s, self.imgsz, stride=self.stride)[0]
-
-            # Convert
-            # BGR to RGB, to 3x416x416
-            img = img[:, :, ::-1].transpose(2, 0, 1)
-            img = np.ascontiguousarray(img)
+            fingerprint, detections = self.cache.lookup(im0s)
+            if detections is None:
+                start = time.perf_counter()
+                detections = self.detectImage(im0s)
+                self.cache.store(fingerprint, im0s, detections, time.perf_counter() - start)
 
-            detections = self.detect(im0s, img) # class_ID, x, y, w, h, confi
-            
+            # the boxes are anchored with the current transform also when the detections are reused
             boundingBoxes = BoundingBoxes()
             boundingBoxes.header.stamp = self.get_clock().now().to_msg()
             boundingBoxes.header.frame_id = "map"
+            # sides of the map [m], the detections are normalized by its pixels
+            mapHeight, mapWidth = (side*self.map_resolution for side in im0s.shape[:2])
             for detection in detections:
                 
                 x = float(detection[1])
@@ -137,12 +201,12 @@ class Detector(Node):
                 if detection[0] != None:
 
                     # put center value in middle of map and convert to meters
-                    x = (x - 0.5) * self.map_size
+                    x = (x - 0.5) * mapWidth
                     # put center value in middle of map and convert to meters
-                    y = (y - 0.5) * self.map_size
+                    y = (y - 0.5) * mapHeight
 
-                    w = w * self.map_size  # transform to meters
-                    h = h * self.map_size  # transform to meters
+                    w = w * mapWidth  # transform to meters
+                    h = h * mapHeight  # transform to meters
 
                     # transform center coordinates into /map frame
                     # orientation does not matter since the two maps are x,y-colinear
@@ -153,37 +217,39 @@ class Detector(Node):
                     bb.width = w
                     bb.height = h
                     boundingBoxes.boundingboxes.append(bb)
-            self.interaction_publisher.publish(boundingBoxes)
+            return boundingBoxes
         except Exception as e:
             print(f"Exception on social_zone_callback")
             print(e)
+            return None
+
+    def detectImage(self, im0s):
+        '''Runs the model on the social map im0s and returns its detections, [] when there are none'''
+        # Convert image to rgb for YOLOv7
+        im0s = cv2.cvtColor(im0s, cv2.COLOR_GRAY2RGB)
+        self.timestamp = self.get_clock().now().nanoseconds
+
+        if self.padMaps:
+            # pyramid levels that fit into the input keep their pixels and are only padded to img_size,
+            # with cost 0 like the free space of the map instead of the gray of letterbox
+            img = letterbox(im0s, self.imgsz, color=(0, 0, 0), stride=self.stride, auto=False, scaleup=False)[0]
+        else:
+            img = letterbox(im0s, self.imgsz, stride=self.stride)[0]
+
+        # Convert
+        # BGR to RGB, to 3x416x416
+        img = img[:, :, ::-1].transpose(2, 0, 1)
+        img = np.ascontiguousarray(img)
+
+        detections = self.detect(im0s, img) # class_ID, x, y, w, h, confi
+        if detections[0] is None:
+            return []
+        return detections
 
     def detect(self, im0, img):
 
-        img = torch.from_numpy(img).to(self.device)
-        img = img.half() if self.half else img.float()  # uint8 to fp16/32
-        img /= 255.0  # 0 - 255 to 0.0 - 1.0
-        if img.ndimension() == 3:
-            img = img.unsqueeze(0)
-
-        # Warmup
-        if self.device.type != 'cpu' and (self.old_img_b != img.shape[0] or self.old_img_h != img.shape[2] or self.old_img_w != img.shape[3]):
-            self.old_img_b = img.shape[0]
-            self.old_img_h = img.shape[2]
-            self.old_img_w = img.shape[3]
-            for i in range(3):
-                self.model(img, augment=self.augment)[0]
-
-        # Inference
-        t1 = time_synchronized()
-        with torch.no_grad():   # Calculating gradients would cause a GPU memory leak
-            pred = self.model(img, augment=self.augment)[0]
-        t2 = time_synchronized()
-
-        # Apply NMS
-        pred = non_max_suppression(
-            pred, self.conf_thres, self.iou_thres, classes=self.classes, agnostic=self.agnostic_nms)
-        t3 = time_synchronized()
+        # Inference and NMS, detections xyxy, conf, cls in the pixels of img
+        pred = [self.backend.predict(img)]
 
         # Process detections
         for i, det in enumerate(pred):  # detections per image
@@ -195,13 +261,13 @@ class Detector(Node):
             if len(det):
                 # Rescale boxes from img_size to im0 size
                 det[:, :4] = scale_coords(
-                    img.shape[2:], det[:, :4], im0.shape).round()
+                    img.shape[1:], det[:, :4], im0.shape).round()
 
                 # Print results
                 for c in det[:, -1].unique():
                     n = (det[:, -1] == c).sum()  # detections per class
                     # add to string
-                    s += f"{n} {self.names[int(c)]}{'s' * (n > 1)}, "
+                    s += f"{n} {self.names[int(c)] if self.names else int(c)}{'s' * (n > 1)}, "
                 
                 detections= []
                 # Write results
@@ -236,6 +302,10 @@ def main(args=None):
         detector = Detector()
         rclpy.spin(detector)
 
+    print(detector.cache.report())
+    if detector.tracer.enabled:
+        print(detector.tracer.report())
+        detector.tracer.dump()
     detector.destroy_node()
     rclpy.shutdown()
 
@@ -24,6 +24,7 @@ setup(
     entry_points={
         'console_scripts': [
             'interaction_detection = interaction_detection.detectContextNode:main',
+            'interaction_detection_onnx = interaction_detection.backends:main',
         ],
     },
 )
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+'''
+Writes nms_fixture.onnx, the ONNX Runtime NMS head of End2End on raw predictions read from the image
+
+The graph is built with onnx.helper node by node like ONNX_ORT.forward is traced, so the
+postprocessing of OnnxRuntimeBackend and the thresholds and class offset of the exported NMS
+can be tested without the weights. Instead of a network the first ROWS rows of the first channel
+hold one candidate each, the columns x, y, w, h [px], objectness and the class confidences,
+as pixel/255 times SCALE.
+
+Only needs onnx, run it again after changing the head: python3 make_nms_fixture.py
+'''
+import json
+from pathlib import Path
+
+import numpy as np
+import onnx
+from onnx import helper, TensorProto
+
+IMG_SIZE = 64
+ROWS = 16
+NAMES = ['interaction', 'group']
+CONF_THRES = 0.25
+IOU_THRES = 0.45
+MAX_OBJ = 100
+MAX_WH = 4096  # NMS_MAX_WH of backends
+SCALE = np.array([IMG_SIZE]*4 + [1.0]*(1 + len(NAMES)), dtype=np.float32)
+OUTPUT = Path(__file__).with_name('nms_fixture.onnx')
+
+
+def const(name, value, dtype=np.float32):
+    return helper.make_tensor(name, onnx.helper.np_dtype_to_tensor_dtype(np.dtype(dtype)),
+                              np.shape(value), np.asarray(value, dtype=dtype).flatten().tolist())
+
+
+def makeFixture(output=OUTPUT):
+    columns = 5 + len(NAMES)
+    initializers = [
+        const('starts', [0, 0, 0, 0], np.int64), const('ends', [1, 1, ROWS, columns], np.int64),
+        const('shape', [1, ROWS, columns], np.int64), const('scale', SCALE),
+        const('box_start', [0], np.int64), const('box_end', [4], np.int64),
+        const('conf_end', [5], np.int64), const('cls_end', [columns], np.int64),
+        const('axis2', [2], np.int64),
+        const('convert_matrix', [[1, 0, 1, 0], [0, 1, 0, 1], [-0.5, 0, 0.5, 0], [0, -0.5, 0, 0.5]]),
+        const('max_wh', MAX_WH), const('max_obj', [MAX_OBJ], np.int64),
+        const('iou_threshold', [IOU_THRES]), const('score_threshold', [CONF_THRES]),
+        const('batch_anchor', [0, 2], np.int64), const('batch', [0], np.int64),
+    ]
+    nodes = [
+        # raw predictions (1, ROWS, 5 + classes) in place of the network
+        helper.make_node('Slice', ['images', 'starts', 'ends'], ['rows']),
+        helper.make_node('Reshape', ['rows', 'shape'], ['raw']),
+        helper.make_node('Mul', ['raw', 'scale'], ['x']),
+        # ONNX_ORT.forward
+        helper.make_node('Slice', ['x', 'box_start', 'box_end', 'axis2'], ['xywh']),
+        helper.make_node('Slice', ['x', 'box_end', 'conf_end', 'axis2'], ['conf']),
+        helper.make_node('Slice', ['x', 'conf_end', 'cls_end', 'axis2'], ['cls']),
+        helper.make_node('Mul', ['cls', 'conf'], ['scores']),
+        helper.make_node('MatMul', ['xywh', 'convert_matrix'], ['boxes']),
+        helper.make_node('ReduceMax', ['scores'], ['max_score'], axes=[2], keepdims=1),
+        helper.make_node('ArgMax', ['scores'], ['category_id'], axis=2, keepdims=1),
+        helper.make_node('Cast', ['category_id'], ['category'], to=TensorProto.FLOAT),
+        helper.make_node('Mul', ['category', 'max_wh'], ['dis']),
+        helper.make_node('Add', ['boxes', 'dis'], ['nmsbox']),
+        helper.make_node('Transpose', ['max_score'], ['max_score_tp'], perm=[0, 2, 1]),
+        helper.make_node('NonMaxSuppression', ['nmsbox', 'max_score_tp', 'max_obj', 'iou_threshold',
+                                               'score_threshold'], ['selected_indices']),
+        helper.make_node('Gather', ['selected_indices', 'batch_anchor'], ['XY'], axis=1),
+        helper.make_node('Gather', ['selected_indices', 'batch'], ['X'], axis=1),
+        helper.make_node('GatherND', ['boxes', 'XY'], ['selected_boxes']),
+        helper.make_node('GatherND', ['category', 'XY'], ['selected_categories']),
+        helper.make_node('GatherND', ['max_score', 'XY'], ['selected_scores']),
+        helper.make_node('Cast', ['X'], ['X_float'], to=TensorProto.FLOAT),
+        helper.make_node('Concat', ['X_float', 'selected_boxes', 'selected_categories', 'selected_scores'],
+                         ['output'], axis=1),
+    ]
+    graph = helper.make_graph(
+        nodes, 'nms_fixture',
+        [helper.make_tensor_value_info('images', TensorProto.FLOAT, [1, 3, IMG_SIZE, IMG_SIZE])],
+        [helper.make_tensor_value_info('output', TensorProto.FLOAT, ['detections', 7])],
+        initializers)
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 12)], producer_name='make_nms_fixture')
+    model.ir_version = 7
+    for key, value in (('stride', '32'), ('names', json.dumps(NAMES))):
+        meta = model.metadata_props.add()
+        meta.key, meta.value = key, value
+    onnx.checker.check_model(model)
+    onnx.save(model, str(output))
+    return output
+
+
+if __name__ == '__main__':
+    print(f'wrote {makeFixture()}')
@@ -0,0 +1,111 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('onnxruntime')
+
+from interaction_detection.backends import compareBackends, exportOnnx, OnnxRuntimeBackend, randomMaps  # noqa: E402
+from interaction_detection.utils.general import non_max_suppression  # noqa: E402
+
+WEIGHTS = Path(os.environ.get(
+    'INTERACTION_DETECTION_WEIGHTS',
+    Path(__file__).parents[1] / 'interaction_detection' / 'yolov7-ContextNav.pt'))
+# End2End NMS head on candidates read from the image, written by fixtures/make_nms_fixture.py
+FIXTURE = Path(__file__).parent / 'fixtures' / 'nms_fixture.onnx'
+
+needsWeights = pytest.mark.skipif(not WEIGHTS.exists(), reason=f'{WEIGHTS} not found')
+
+
+def encode(candidates, img_size):
+    '''
+    Writes the (n, 5 + classes) candidates x, y, w, h [px], objectness, class confidences into
+    the rows of a fixture image
+
+    Return
+    ----------
+    img: (3, img_size, img_size) uint8 image for OnnxRuntimeBackend.predict
+    decoded: (n, 5 + classes) float32 candidates the fixture reads back from img
+    '''
+    candidates = np.asarray(candidates, dtype=np.float32)
+    scale = np.ones(candidates.shape[1], dtype=np.float32)
+    scale[:4] = img_size
+    pixels = np.clip(np.round(candidates/scale*255), 0, 255).astype(np.uint8)
+    img = np.zeros((3, img_size, img_size), dtype=np.uint8)
+    img[0, :len(pixels), :pixels.shape[1]] = pixels
+    return img, pixels.astype(np.float32)/255.0*scale
+
+
+@pytest.fixture(scope='module')
+def fixtureBackend():
+    return OnnxRuntimeBackend(FIXTURE)
+
+
+def test_fixture_thresholds_and_class_offset(fixtureBackend):
+    assert fixtureBackend.imgsz == 64
+    assert fixtureBackend.names == ['interaction', 'group']
+    img, decoded = encode([
+        [20, 20, 10, 10, 1.0, 0.9, 0.1],  # kept
+        [21, 20, 10, 10, 1.0, 0.8, 0.1],  # overlaps the first of the same class
+        [20, 20, 10, 10, 1.0, 0.1, 0.7],  # overlaps the first of the other class
+        [45, 45, 8, 8, 0.5, 0.4, 0.1],  # below conf_thres after the objectness
+        [45, 15, 8, 8, 1.0, 0.6, 0.1],  # kept
+    ], fixtureBackend.imgsz)
+    det = fixtureBackend.predict(img).numpy()
+
+    assert det.shape == (3, 6)
+    assert det[:, 5].tolist() == [0, 1, 0]
+    expected = decoded[[0, 2, 4]]
+    assert np.allclose(det[:, 4], expected[:, 4]*expected[:, 5:].max(1))
+    assert np.allclose(det[:, :2], expected[:, :2] - expected[:, 2:4]/2)
+    assert np.allclose(det[:, 2:4], expected[:, :2] + expected[:, 2:4]/2)
+
+    fixtureBackend.classes = [1]
+    try:
+        assert fixtureBackend.predict(img).numpy()[:, 5].tolist() == [1]
+    finally:
+        fixtureBackend.classes = None
+
+
+def test_fixture_empty_map(fixtureBackend):
+    det = fixtureBackend.predict(np.zeros((3, 64, 64), dtype=np.uint8))
+    assert det.shape == (0, 6)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_fixture_matches_non_max_suppression(fixtureBackend, seed):
+    # candidates crowded around three people, so the IOU threshold and the class offset both matter
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(16, 48, (3, 2))[rng.integers(0, 3, 16)] + rng.normal(0, 2, (16, 2))
+    candidates = np.concatenate([
+        centers, rng.uniform(8, 16, (16, 2)), rng.uniform(0.2, 1.0, (16, 1)), rng.uniform(0.0, 1.0, (16, 2))], 1)
+    img, decoded = encode(candidates, fixtureBackend.imgsz)
+
+    reference = non_max_suppression(torch.from_numpy(decoded[None]), 0.25, 0.45)[0].numpy()
+    det = fixtureBackend.predict(img).numpy()
+    assert len(reference)
+    assert det.shape == reference.shape
+    assert np.allclose(det, reference, atol=1e-4)
+
+
+@pytest.fixture(scope='module')
+def onnxModel(tmp_path_factory):
+    return exportOnnx(WEIGHTS, tmp_path_factory.mktemp('onnx') / 'model.onnx', img_size=320)
+
+
+@needsWeights
+def test_onnxruntime_matches_torch(onnxModel):
+    results = compareBackends(WEIGHTS, onnxModel, randomMaps(10), runs=20)
+    assert results['unmatched'] == 0, results
+    assert results['boxError'] < 1.0, results
+    assert results['scoreError'] < 1e-2, results
+
+
+@needsWeights
+def test_onnxruntime_empty_map(onnxModel):
+    backend = OnnxRuntimeBackend(onnxModel)
+    assert backend.imgsz == 320
+    det = backend.predict(randomMaps(1)[0] * 0)
+    assert det.shape[1] == 6
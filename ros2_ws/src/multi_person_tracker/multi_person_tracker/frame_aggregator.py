@@ -0,0 +1,108 @@
+import threading
+import time
+import numpy as np
+import cv2
+from typing import List
+
+
+class Frame(object):
+    '''
+    Latest rgb/depth pair of one camera waiting for pose inference
+
+    Parameters
+    ----------
+    camera: Camera object the frame belongs to
+    rgb: BGRA image as received from the camera
+    depth: depth image in meters aligned with rgb
+    timestamp: time of arrival of the frame in ns
+    stamp: capture stamp of the image message in ns
+    '''
+
+    def __init__(self, camera, rgb: np.ndarray, depth: np.ndarray, timestamp: int, stamp: int = None):
+        self.camera = camera
+        self.rgb = rgb
+        self.depth = depth
+        self.timestamp = timestamp
+        self.stamp = stamp
+        self.arrival = time.monotonic()
+
+
+class TiledKeypoint(object):
+    '''Keypoint of a pose in the coordinates of the camera image it was detected in'''
+
+    def __init__(self, ID: int, x: float, y: float):
+        self.ID = ID
+        self.x = x
+        self.y = y
+
+
+class TiledPose(object):
+    '''Pose scattered back from the mosaic, mimics the Keypoints attribute of a poseNet pose'''
+
+    def __init__(self, keypoints: List[TiledKeypoint]):
+        self.Keypoints = keypoints
+
+
+class FrameAggregator(object):
+    '''
+    Runs a single inference over the latest frames of all cameras
+
+    poseNet has no batch dimension, therefore the frames are tiled horizontally into one
+    mosaic which is processed in one network call. The detected poses are assigned to the
+    tile containing the majority of their keypoints and shifted back into the coordinates
+    of that camera, so the per camera post processing is unchanged.
+    Gathering the frames of a batch is left to the InferenceWorkerPool.
+    The tiles share the input resolution of the network, so every camera is seen with less
+    horizontal resolution than alone, it is opt-in until its accuracy is measured.
+
+    Parameters
+    ----------
+    tracker: MultiPersonTracker owning the network
+    '''
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.mosaic = None
+        # the mosaic buffer is shared by all workers
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.frames = 0
+
+    def process(self, frames: List[Frame]):
+        with self.lock:
+            mosaic, offsets = self.tile(frames)
+            poses = self.tracker.detectBatch(mosaic, frames)
+            self.batches += 1
+            self.frames += len(frames)
+        if poses is None:
+            return
+        for frame, framePoses in zip(frames, self.scatter(poses, offsets)):
+            frame.camera.processPoses(framePoses, frame.depth, frame.timestamp, frame.stamp)
+
+    def tile(self, frames: List[Frame]):
+        '''Convert the frames side by side into a reused float32 RGBA mosaic buffer'''
+        height = max(frame.rgb.shape[0] for frame in frames)
+        tileWidths = [frame.rgb.shape[1] for frame in frames]
+        offsets = np.cumsum([0] + tileWidths[:-1])
+        shape = (height, sum(tileWidths), 4)
+        if self.mosaic is None or self.mosaic.shape != shape:
+            self.mosaic = np.zeros(shape, dtype=np.float32)
+        for frame, offset, width in zip(frames, offsets, tileWidths):
+            self.mosaic[:frame.rgb.shape[0], offset:offset+width] = cv2.cvtColor(
+                frame.rgb, cv2.COLOR_BGRA2RGBA)
+        return self.mosaic, offsets
+
+    def scatter(self, poses, offsets):
+        '''Assign the poses of the mosaic to the frames they were detected in'''
+        scattered = [[] for _ in offsets]
+        for pose in poses:
+            if not len(pose.Keypoints):
+                continue
+            xs = np.array([kp.x for kp in pose.Keypoints])
+            tiles = np.searchsorted(offsets, xs, side='right') - 1
+            tile = int(np.bincount(tiles).argmax())
+            # drop keypoints that leaked over the seam into a neighbouring tile
+            keypoints = [TiledKeypoint(kp.ID, kp.x - int(offsets[tile]), kp.y)
+                         for kp, t in zip(pose.Keypoints, tiles) if t == tile]
+            scattered[tile].append(TiledPose(keypoints))
+        return scattered
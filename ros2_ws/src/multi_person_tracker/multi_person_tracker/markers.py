@@ -0,0 +1,68 @@
+from typing import Callable, Dict
+
+from visualization_msgs.msg import Marker, MarkerArray
+
+
+class MarkerCache(object):
+    '''
+    Keeps one Marker per track ID and only publishes markers that changed
+
+    Markers are created once per track and updated in place, tracks that disappeared are
+    removed in RViz with a DELETE action. Every refreshPeriod all markers are republished
+    so late joining RViz clients receive the unchanged ones as well.
+
+    Parameters
+    ----------
+    publisher: MarkerArray publisher
+    frame_id: frame of the markers
+    makeMarker: function(marker_id) returning a new Marker with the static fields set
+    updateMarker: function(marker, track) writing the track into the marker
+    signature: function(track) returning a hashable value that changes when the marker has to be republished
+    refreshPeriod: seconds after which all markers are republished
+    '''
+
+    def __init__(self, publisher, frame_id: str, makeMarker: Callable, updateMarker: Callable,
+                 signature: Callable, refreshPeriod: float = 1.0):
+        self.publisher = publisher
+        self.frame_id = frame_id
+        self.makeMarker = makeMarker
+        self.updateMarker = updateMarker
+        self.signature = signature
+        self.refreshPeriod = refreshPeriod
+        self.markers: Dict[int, Marker] = {}
+        self.signatures: Dict[int, object] = {}
+        self.lastRefresh = None
+        self.msg = MarkerArray()
+
+    def publish(self, tracks: Dict[int, object], stamp, now_ns: int):
+        '''
+        Publishes the changed markers of tracks {track_id: track} and deletes the markers of removed tracks
+        '''
+        refresh = self.lastRefresh is None or (now_ns - self.lastRefresh)*1e-9 >= self.refreshPeriod
+        if refresh:
+            self.lastRefresh = now_ns
+        changed = []
+        for track_id, track in tracks.items():
+            signature = self.signature(track)
+            marker = self.markers.get(track_id)
+            if marker is None:
+                marker = self.makeMarker(track_id)
+                marker.header.frame_id = self.frame_id
+                self.markers[track_id] = marker
+            elif not refresh and self.signatures[track_id] == signature:
+                continue
+            self.updateMarker(marker, track)
+            marker.header.stamp = stamp
+            self.signatures[track_id] = signature
+            changed.append(marker)
+
+        for track_id in [track_id for track_id in self.markers if track_id not in tracks]:
+            marker = self.markers.pop(track_id)
+            del self.signatures[track_id]
+            marker.action = Marker.DELETE
+            marker.header.stamp = stamp
+            changed.append(marker)
+
+        if changed:
+            self.msg.markers = changed
+            self.publisher.publish(self.msg)
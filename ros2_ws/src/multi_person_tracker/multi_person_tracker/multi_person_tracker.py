@@ -5,27 +5,34 @@ import threading
 import numpy as np
 import cv2
 from cv_bridge import CvBridge
-from tf_transformations import euler_from_quaternion, quaternion_about_axis
+from tf_transformations import quaternion_about_axis
 import tf2_ros
-import tf2_geometry_msgs
 import jetson_utils
 from jetson_inference import poseNet
 from jetson_utils import videoOutput
 import csv  # DC remove later
 
 from sensor_msgs.msg import Image
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
 from visualization_msgs.msg import Marker, MarkerArray
-from geometry_msgs.msg import Pose, PointStamped
+from geometry_msgs.msg import Point
 
 from .person_keypoints import *
 from multi_person_tracker_interfaces.msg import People, Person
 from .tracking import PeopleTracker, Detection
+from .frame_aggregator import FrameAggregator, Frame
+from .scheduling import InferenceWorkerPool, AdaptiveRateScheduler
+from .transforms import CachedTransform, makeDetections
+from .markers import MarkerCache
+from .tracing import Tracer, stampToNs
 from rclpy.qos import QoSProfile, HistoryPolicy, DurabilityPolicy, ReliabilityPolicy
+from rclpy.callback_groups import MutuallyExclusiveCallbackGroup, ReentrantCallbackGroup
+from rclpy.executors import MultiThreadedExecutor
 
 
 
 class MultiPersonTracker(Node):
-    def __init__(self, publishPoseMsg: bool = True, publishKeypoints: bool = False, dt=0.1, n_cameras=2, newTrack=3, keeptime=5, target_frame: str = "map", debug: bool = False):
+    def __init__(self, publishPoseMsg: bool = True, publishKeypoints: bool = False, dt=0.1, markerDt=0.1, n_cameras=2, newTrack=3, keeptime=5, target_frame: str = "map", batchInference: bool = False, batchLatency: float = 0.02, n_workers: int = 1, slotDepth: int = 1, transformMaxAge: float = 0.0, adaptiveRate: bool = False, minRate: float = 10.0, maxRate: float = 30.0, debug: bool = False):
         '''
         Class for pose estimation of a person using Nvidia jetson Orin implementation
         of PoseNet and passing messages using ROS2.
@@ -36,26 +43,63 @@ class MultiPersonTracker(Node):
         publishPoseMsg: publish filtered marker arrows to the ROS2 network 
         publishKeypoints: publish non filtered keypoints as markers
         dt: rate of prediction for the trackers
+        markerDt: rate at which changed markers are published, independent of dt
         n_cameras: number of publishing cameras on the ROS2 network
         newTrack: meters distance at which detection is not assigned to tracklets and new ones are generated 
         keeptime: seconds to keep tracklets after last detection
         target_frame ouput tf_frame of the poses
+        batchInference: default of the batch_inference parameter, tile the latest frames of all cameras into
+            one image and run PoseNet once per batch, every camera gets a narrower part of the input of the network
+        batchLatency: seconds a frame waits for the frames of the other cameras before a partial batch is run
+        n_workers: number of threads running inference and post processing outside of the executor
+        slotDepth: frames queued per camera before the oldest one is dropped
+        transformMaxAge: default of the transform_max_age parameter, 0 looks up the camera transform at
+            the stamp of every image, a positive value reuses the latest one for that many seconds,
+            only for a target_frame fixed to the robot
+        adaptiveRate: default of the adaptive_rate parameter, lower the inference rate of the cameras
+            while all tracks are certain, also in an empty scene, so a person entering is detected
+            up to 1/min_rate seconds later
+        minRate: default of the min_rate parameter, lowest inference rate per camera in Hz when adaptive_rate is used
+        maxRate: default of the max_rate parameter, highest inference rate per camera in Hz when adaptive_rate is used
         debug: display debug messages in the console
         '''
 
         super().__init__('multi_person_tracker')
-        self.create_timer(dt, self.timer_callback)
+        # keep publishing on its own callback group so slow frames can not stall it
+        self.publish_group = MutuallyExclusiveCallbackGroup()
+        self.camera_group = ReentrantCallbackGroup()
+        self.create_timer(dt, self.timer_callback,
+                          callback_group=self.publish_group)
         self.people_tracker = PeopleTracker(
             newTrack=newTrack, keeptime=keeptime, dt=dt, debug=debug)
+        # latency tracing from the camera stamp, enabled with PERCEPTION_TRACING=1
+        self.tracer = Tracer.fromEnvironment(
+            'multi_person_tracker', clock=lambda: self.get_clock().now().nanoseconds)
+        self.lastImageStamp = None
+        # functions(header, people) receiving the (N, 6) track snapshot of every prediction step
+        self.trackSinks = []
         self.people_publisher = self.create_publisher(People, 'people', 10)
         self.people_arrow_publisher = self.create_publisher(
             MarkerArray, 'people_arrows', 10)
         self.people_keypoint_publisher = self.create_publisher(
             MarkerArray, 'people_keypoints', 10)
+        self.diagnostics_publisher = self.create_publisher(
+            DiagnosticArray, 'diagnostics', 10)
         self.publishPoseMsg = publishPoseMsg
         self.publishKeypointsMsg = publishKeypoints
         self.debug = debug
         self.target_frame = target_frame
+        self.transformMaxAge = float(self.declare_parameter('transform_max_age', transformMaxAge).value)
+        # markers are reused per track and only sent when they changed
+        self.arrowMarkers = MarkerCache(
+            self.people_arrow_publisher, self.target_frame,
+            self.makeArrowMarker, self.updateArrowMarker, self.arrowSignature)
+        self.keypointMarkers = MarkerCache(
+            self.people_keypoint_publisher, self.target_frame,
+            self.makeKeypointMarker, self.updateKeypointMarker, self.keypointSignature)
+        if self.publishPoseMsg or self.publishKeypointsMsg:
+            self.create_timer(markerDt, self.marker_callback,
+                              callback_group=self.publish_group)
         ### Variables for pose detection###
         self.peopleCount = 0
         self.imageCount = -1
@@ -75,12 +119,30 @@ class MultiPersonTracker(Node):
             os.path.basename(__file__)])
 
         self.detectionMergingThreshold = 0.5
+        # the network is not reentrant and the tracklets are shared with the publishing timer
+        self.netLock = threading.Lock()
+        self.trackerLock = threading.Lock()
+        # Gather frames of multiple cameras for a single inference
+        self.aggregator = None
+        if self.declare_parameter('batch_inference', batchInference).value and n_cameras > 1:
+            self.aggregator = FrameAggregator(self)
+        self.workers = InferenceWorkerPool(
+            self.aggregator, n_workers=n_workers, slotDepth=slotDepth, latencyBudget=batchLatency)
+        # skips frames while the tracks are certain and nobody new is in view
+        self.scheduler = None
+        if self.declare_parameter('adaptive_rate', adaptiveRate).value:
+            self.scheduler = AdaptiveRateScheduler(float(self.declare_parameter('min_rate', minRate).value),
+                                                   float(self.declare_parameter('max_rate', maxRate).value))
+        self.create_timer(1.0, self.publishMetrics,
+                          callback_group=self.publish_group)
         # Initialize camera objects with propper namespacing
         if n_cameras > 1:
             self.cameras = [self.Camera(self, namespace="camera"+str(i+1))
                             for i in range(n_cameras)]
         else:
             self.cameras = [self.Camera(self)]
+        for camera in self.cameras:
+            self.workers.addCamera(camera)
 
     def timer_callback(self):
         # Publishes Tracker Ouput and predicts next state
@@ -89,91 +151,184 @@ class MultiPersonTracker(Node):
         # TODO change when we have tf goodness
         people.header.frame_id = self.target_frame
         # TODO implement index and reliabílity
-        for p in self.people_tracker.tracklets:
-            person = Person()
-            person.position.x = float(p.personX)
-            person.position.y = float(p.personY)
-            person.position.z = float(p.personTheta)
-            person.velocity.x = float(p.personXdot)
-            person.velocity.y = float(p.personYdot)
-            person.velocity.z = float(p.personThetadot)
-            people.people.append(person)
-
-        self.people_publisher.publish(people)
+        with self.trackerLock:
+            if self.trackSinks:
+                # in process consumers get the tracks before they are serialized
+                snapshot = np.array([[float(p.personX), float(p.personY), float(p.personTheta),
+                                      float(p.personXdot), float(p.personYdot), float(p.personThetadot)]
+                                     for p in self.people_tracker.tracklets], dtype=float).reshape(-1, 6)
+                for sink in self.trackSinks:
+                    sink(people.header, snapshot)
+            for p in self.people_tracker.tracklets:
+                person = Person()
+                person.position.x = float(p.personX)
+                person.position.y = float(p.personY)
+                person.position.z = float(p.personTheta)
+                person.velocity.x = float(p.personXdot)
+                person.velocity.y = float(p.personYdot)
+                person.velocity.z = float(p.personThetadot)
+                people.people.append(person)
+
+            self.people_publisher.publish(people)
+            if self.lastImageStamp:
+                self.tracer.mark('people', self.lastImageStamp,
+                                 key=stampToNs(people.header.stamp))
+            now = self.get_clock().now().nanoseconds
+            self.people_tracker.predict(now)
+            if self.scheduler:
+                self.scheduler.update(self.people_tracker.tracklets,
+                                      self.people_tracker.nextTrackId, now)
+
+    def addTrackSink(self, sink):
+        '''
+        Registers sink(header, people) which is called with the (N, 6) array of x, y, theta, xdot, ydot, thetadot
+        of all tracks every prediction step, before the People message is published
+        '''
+        self.trackSinks.append(sink)
+
+    def publishMetrics(self):
+        # Publishes queue depth and dropped frames of every camera
+        diagnostics = DiagnosticArray()
+        diagnostics.header.stamp = self.get_clock().now().to_msg()
+        for camera, depth, received, dropped, processed in self.workers.metrics():
+            status = DiagnosticStatus()
+            status.name = f"{self.get_name()}: {camera.namespace} inference queue"
+            status.hardware_id = camera.namespace
+            status.level = DiagnosticStatus.OK
+            status.message = f"{dropped} of {received} frames dropped"
+            status.values = [KeyValue(key="queue_depth", value=str(depth)),
+                             KeyValue(key="received", value=str(received)),
+                             KeyValue(key="dropped", value=str(dropped)),
+                             KeyValue(key="processed", value=str(processed))]
+            diagnostics.status.append(status)
+        if self.scheduler:
+            status = DiagnosticStatus()
+            status.name = f"{self.get_name()}: adaptive inference rate"
+            status.level = DiagnosticStatus.OK
+            status.message = f"{100*self.scheduler.computeSaved():.1f}% of frames skipped"
+            status.values = [KeyValue(key="rate", value=f"{self.scheduler.rate:.1f}")]
+            status.values += [KeyValue(key=f"{camera.namespace}_skipped", value=f"{skipped} of {received}")
+                              for camera, received, skipped in self.scheduler.metrics()]
+            diagnostics.status.append(status)
+        if self.tracer.enabled:
+            status = DiagnosticStatus()
+            status.name = f"{self.get_name()}: latency from camera stamp"
+            status.level = DiagnosticStatus.OK
+            status.values = [KeyValue(key=stage, value=f"n={count} p50={p50:.1f}ms p90={p90:.1f}ms p99={p99:.1f}ms")
+                             for stage, count, p50, p90, p99, maximum in self.tracer.summary()]
+            diagnostics.status.append(status)
+        self.diagnostics_publisher.publish(diagnostics)
+
+    def marker_callback(self):
+        # Publishes the markers of the tracks that changed since the last call
+        with self.trackerLock:
+            tracklets = list(self.people_tracker.tracklets)
+        now = self.get_clock().now()
         if self.publishPoseMsg:
-            self.publishPoseArrows(self.people_tracker.tracklets)
+            self.publishPoseArrows(tracklets, now)
         if self.publishKeypointsMsg:
-            self.publishKeypoints(self.people_tracker.tracklets)
-        self.people_tracker.predict(self.get_clock().now().nanoseconds)
-
-    def publishPoseArrows(self, people):
-        # Set the scale of the marker
-        marker_array_msg = MarkerArray()
-
-        for i, person in enumerate(people):
-            # Set the pose of the marker
-            if (person.personX and person.personY and person.personTheta):
-                quad = quaternion_about_axis(person.personTheta, (0, 0, 1))
-                marker = Marker()
-                marker.header.frame_id = self.target_frame
-                marker.header.stamp = self.get_clock().now().to_msg()
-                marker.type = 0
-                marker.id = i
-                marker.pose.position.x = float(person.personX)
-                marker.pose.position.y = float(person.personY)
-                marker.pose.position.z = float(0)
-                marker.pose.orientation.x = quad[0]
-                marker.pose.orientation.y = quad[1]
-                marker.pose.orientation.z = quad[2]
-                marker.pose.orientation.w = quad[3]
-                marker.scale.x = 1.0
-                marker.scale.y = 0.1
-                marker.scale.z = 0.1
-
-                # Set the color
-                marker.color.r = 0.0
-                marker.color.g = 1.0
-                marker.color.b = 0.0
-                marker.color.a = 1.0
-                marker.frame_locked = False
-                marker_array_msg.markers.append(marker)
-        self.people_arrow_publisher.publish(marker_array_msg)
-
-    def publishKeypoints(self, people):
-        # Set the scale of the marker
-        marker_array_msg = MarkerArray()
-        for i, person in enumerate(people):
-            # Set the pose of the marker
-            if (person.personX and person.personY and person.personTheta and len(person.keypoints)):
-                # Set the pose of the marker
-                marker = Marker()
-                marker.header.frame_id = self.target_frame
-                marker.header.stamp = self.get_clock().now().to_msg()
-                marker.type = 8
-                marker.id = i
-                marker.scale.x = .05
-                marker.scale.y = .05
-                marker.scale.z = .05
-                marker.color.r = 0.0
-                marker.color.g = 1.0
-                marker.color.b = 0.0
-                marker.color.a = 1.0
-                for kp in person.keypoints:
-                    marker.points.append(kp.point)
-                marker_array_msg.markers.append(marker)
-        self.people_keypoint_publisher.publish(marker_array_msg)
+            self.publishKeypoints(tracklets, now)
+
+    def publishPoseArrows(self, people, now):
+        tracks = {person.trackId: person for person in people
+                  if (person.personX and person.personY and person.personTheta)}
+        self.arrowMarkers.publish(tracks, now.to_msg(), now.nanoseconds)
+
+    def publishKeypoints(self, people, now):
+        tracks = {person.trackId: person for person in people
+                  if (person.personX and person.personY and person.personTheta and len(person.keypoints))}
+        self.keypointMarkers.publish(tracks, now.to_msg(), now.nanoseconds)
+
+    @staticmethod
+    def makeArrowMarker(marker_id):
+        marker = Marker()
+        marker.type = Marker.ARROW
+        marker.id = marker_id
+        marker.pose.position.z = float(0)
+        marker.scale.x = 1.0
+        marker.scale.y = 0.1
+        marker.scale.z = 0.1
+
+        # Set the color
+        marker.color.r = 0.0
+        marker.color.g = 1.0
+        marker.color.b = 0.0
+        marker.color.a = 1.0
+        marker.frame_locked = False
+        return marker
+
+    @staticmethod
+    def updateArrowMarker(marker, person):
+        # Set the pose of the marker
+        quad = quaternion_about_axis(float(person.personTheta), (0, 0, 1))
+        marker.pose.position.x = float(person.personX)
+        marker.pose.position.y = float(person.personY)
+        marker.pose.orientation.x = quad[0]
+        marker.pose.orientation.y = quad[1]
+        marker.pose.orientation.z = quad[2]
+        marker.pose.orientation.w = quad[3]
+
+    @staticmethod
+    def arrowSignature(person):
+        # republish once the arrow moved by a millimeter or turned by a milliradian
+        return (round(float(person.personX), 3), round(float(person.personY), 3),
+                round(float(person.personTheta), 3))
+
+    @staticmethod
+    def makeKeypointMarker(marker_id):
+        marker = Marker()
+        marker.type = Marker.SPHERE_LIST
+        marker.id = marker_id
+        marker.scale.x = .05
+        marker.scale.y = .05
+        marker.scale.z = .05
+        marker.color.r = 0.0
+        marker.color.g = 1.0
+        marker.color.b = 0.0
+        marker.color.a = 1.0
+        return marker
+
+    @staticmethod
+    def updateKeypointMarker(marker, person):
+        marker.points = [Point(x=float(kp[0]), y=float(kp[1]), z=float(kp[2]))
+                         for kp in person.keypoints]
+
+    @staticmethod
+    def keypointSignature(person):
+        # keypoints only change when a detection is assigned to the tracklet
+        return person.measTimestamp
 
     def detect(self, cudaImage, depthImage):
         '''
         Perform pose estimation (with overlay)
         '''
         if (cudaImage != None) and isinstance(depthImage, np.ndarray):
-            poses = self.net.Process(
-                cudaImage, overlay=self.overlay)
+            with self.netLock:
+                poses = self.net.Process(
+                    cudaImage, overlay=self.overlay)
             return poses
         else:
             return None
 
+    def detectBatch(self, mosaic, frames):
+        '''
+        Perform pose estimation on the tiled frames of all cameras in a single network pass
+        '''
+        if all(isinstance(frame.depth, np.ndarray) for frame in frames):
+            with self.netLock:
+                self.mosaicImage = jetson_utils.cudaFromNumpy(mosaic)
+                return self.net.Process(
+                    self.mosaicImage, overlay=self.overlay)
+        else:
+            return None
+
+    def destroy_node(self):
+        self.workers.stop()
+        if self.tracer.enabled:
+            print(self.tracer.report())
+            self.tracer.dump()
+        super().destroy_node()
+
     def saveImage(self, cudaImage):
         # render an image of the camera with a pose overlay
         self.imageCount += 1
@@ -204,117 +359,92 @@ class MultiPersonTracker(Node):
             self.tf_buffer = tf2_ros.Buffer(cache_time=rclpy.time.Duration(seconds=5.0))
             self.tf_listener = tf2_ros.TransformListener(
                 self.tf_buffer, self.tracker, spin_thread = True)
+            # looked up at the image stamps unless the target frame is fixed to the robot
+            self.transform = CachedTransform(
+                self.tf_buffer, self.tracker.target_frame, self.tfFrame, maxAge=self.tracker.transformMaxAge)
 
             # Initialize subscribers in tracker object for this camera
             self.rgb_subscription = self.tracker.create_subscription(
                 Image,
                 '/' + namespace+'/color/image_raw',
                 self.rgb_callback,
-                10)
+                10,
+                callback_group=self.tracker.camera_group)
 
             self.depth_subscription = self.tracker.create_subscription(
                 Image,
                 '/' + namespace+'/aligned_depth_to_color/image_raw',
                 self.depth_callback,
-                10)
+                10,
+                callback_group=self.tracker.camera_group)
 
         def rgb_callback(self, msg):
             try:
-                # conversions
+                # only enqueue, inference runs on the worker pool
+                timestamp = self.tracker.get_clock().now().nanoseconds
+                if self.tracker.scheduler and not self.tracker.scheduler.admit(self, timestamp):
+                    return
                 self.rgb = self.bridge.imgmsg_to_cv2(
                     msg, desired_encoding='passthrough')
-                cudaimage = cv2.cvtColor(self.rgb, cv2.COLOR_BGRA2RGBA).astype(
-                    np.float32)  # converting the image to a cuda compatible image
-                self.cudaimage = jetson_utils.cudaFromNumpy(cudaimage)
-                self.timestamp = self.tracker.get_clock().now().nanoseconds
+                self.timestamp = timestamp
+                self.tracker.workers.put(
+                    self, Frame(self, self.rgb, self.depth, self.timestamp, stampToNs(msg.header.stamp)))
+            except Exception as e:
+                if self.debug:
+                    print(f"Exception on rgb_callback")
+                    print(e)
+
+        def inferFrame(self, frame):
+            '''
+            Runs pose estimation on a single frame of this camera
+            '''
+            cudaimage = cv2.cvtColor(frame.rgb, cv2.COLOR_BGRA2RGBA).astype(
+                np.float32)  # converting the image to a cuda compatible image
+            self.cudaimage = jetson_utils.cudaFromNumpy(cudaimage)
 
-                # detect poses when new rgb immage is available
-                poses = self.tracker.detect(
-                    self.cudaimage, self.depth)
+            # detect poses when new rgb immage is available
+            poses = self.tracker.detect(
+                self.cudaimage, frame.depth)
+            self.processPoses(poses, frame.depth, frame.timestamp, frame.stamp)
 
-                # generate 3D coordinates for all keypoints and calculate x,y,theta
+        def processPoses(self, poses, depth, timestamp, stamp):
+            '''
+            Generates 3D coordinates for all keypoints, calculates x,y,theta and updates the tracker
+            '''
+            self.tracker.tracer.mark('inference', stamp, camera=self.namespace)
+            try:
                 if poses:
-                    kpPersons = self.generatePeople(poses)
-                    z = np.array([[complex(p.x, p.y) for p in kpPersons]])
-                    popCounter=0
-                    distanceMatrix=abs(z.T-z)
-                    distanceMatrix = np.where(np.logical_and(0 < distanceMatrix, distanceMatrix < self.tracker.detectionMergingThreshold))
-                    for i,detection in enumerate(distanceMatrix[0]):
-                        kpPersons[detection-popCounter].x = (kpPersons[detection-popCounter].x + kpPersons[distanceMatrix[1][i]-popCounter].x)/2
-                        kpPersons[detection-popCounter].y = (kpPersons[detection-popCounter].y + kpPersons[distanceMatrix[1][i]-popCounter].y)/2
-                        kpPersons[detection-popCounter].orientation = (kpPersons[detection-popCounter].orientation + kpPersons[distanceMatrix[1][i]-popCounter].orientation)/2
-                        kpPersons.pop(distanceMatrix[1][i]-popCounter)
-                        popCounter+=1
-                        if self.debug: print("removed double detection")
+                    kpPersons = mergeDoubleDetections(
+                        generatePeople(poses, depth), self.tracker.detectionMergingThreshold, self.debug)
                     # make detection objects
                     detections = []
-                    trans = None
+                    matrix = None
                     try:
-                        # self.tf_buffer.waitForTransform(self.tfFrame,self.tracker.target_frame, self.tracker.get_clock().now(), rclpy.time.Duration(seconds=5.0))
-                        trans = self.tf_buffer.lookup_transform(
-                            self.tracker.target_frame, self.tfFrame, self.tracker.get_clock().now(),timeout=rclpy.time.Duration(seconds=0.5))
+                        matrix = self.transform.get(stamp if stamp is not None else timestamp)
                     except Exception as e:
                         print(e)
-                    if trans:
-                        pose = Pose()
-                        for person in kpPersons:
-                            try:
-                                if self.tracker.publishKeypoints:
-                                    keypoints = []
-                                    for kp in person.keypoints:
-                                        if kp.x and kp.y and kp.z:
-                                            point = PointStamped()
-                                            point.point.x = float(kp.x)
-                                            point.point.y = float(kp.y)
-                                            point.point.z = float(kp.z)
-                                            point = tf2_geometry_msgs.do_transform_point(
-                                                point, trans)
-                                            keypoints.append(point)
-                                # transformation to target_frame
-                                pose.position.x = float(person.x)
-                                pose.position.y = float(person.y)
-                                pose.position.z = float(0.0)
-                                angle = person.orientation if person.orientation < np.pi else person.orientation-2*np.pi
-                                quad = quaternion_about_axis(
-                                    person.orientation, (0, 0, 1))
-                                pose.orientation.x = quad[0]
-                                pose.orientation.y = quad[1]
-                                pose.orientation.z = quad[2]
-                                pose.orientation.w = quad[3]
-                                pose = tf2_geometry_msgs.do_transform_pose(
-                                    pose, trans)
-                                quad = [
-                                    pose.orientation.x,
-                                    pose.orientation.y,
-                                    pose.orientation.z,
-                                    pose.orientation.w,
-                                ]
-                                angle = euler_from_quaternion(quad)[2]
-                                angle = angle if angle > 0 else angle+2*np.pi
-
-
-                                if self.tracker.publishKeypoints:
-                                    detections.append(
-                                        Detection(pose.position.x, pose.position.y, angle, person.withTheta, keypoints))
-                                else:
-                                    detections.append(
-                                        Detection(pose.position.x, pose.position.y, angle, person.withTheta))
-                            except np.linalg.LinAlgError:
-                                pass
+                    if matrix is not None:
+                        # transformation of all people and keypoints to target_frame at once
+                        detections = makeDetections(
+                            matrix, kpPersons, self.tracker.publishKeypointsMsg)
                         # Update tracker with new detections
                         if len(detections):
-                            self.tracker.people_tracker.update(
-                                detections, self.timestamp)
+                            with self.tracker.trackerLock:
+                                self.tracker.people_tracker.update(
+                                    detections, timestamp)
+                                self.tracker.lastImageStamp = stamp
+                            self.tracker.tracer.mark('tracker_update', stamp, camera=self.namespace)
 
                             # save image and make csv if required
                             if self.debug:
                                 # self.writing(kpPersons)
                                 self.tracker.peopleCount += len(
                                     kpPersons)
-                                self.tracker.saveImage(self.cudaimage)
+                                self.tracker.saveImage(
+                                    self.tracker.mosaicImage if self.tracker.aggregator else self.cudaimage)
             except Exception as e:
                 if self.debug:
-                    print(f"Exception on rgb_callback")
+                    print(f"Exception on processPoses")
                     print(e)
 
         def depth_callback(self, msg):
@@ -330,17 +460,6 @@ class MultiPersonTracker(Node):
                     print(f"Exception on depth_callback")
                     print(e)
 
-        def generatePeople(self, poses):
-            '''
-            Calculates the location of the person as X and Y coordinates along with the orientation of the person
-            '''
-            persons = []
-            for pose in poses:
-                kpPerson = person_keypoint(pose.Keypoints, self.depth)
-                if kpPerson.x != None and kpPerson.y != None:
-                    persons.append(kpPerson)
-            return persons
-
         def writing(self, orientation):
             '''
             Data collection function for writing csv file with person variables for captured images
@@ -361,8 +480,12 @@ def main(args=None):
     rclpy.init(args=args)
   # Start ROS2 node
     multi_person_tracker = MultiPersonTracker(publishKeypoints=False,
-                                              dt=0.02, target_frame="camera_link", debug=False)
-    rclpy.spin(multi_person_tracker)
+                                              dt=0.02, target_frame="camera_link", transformMaxAge=1.0,
+                                              debug=False)
+    # camera callbacks, workers and the publishing timer must not block each other
+    executor = MultiThreadedExecutor()
+    executor.add_node(multi_person_tracker)
+    executor.spin()
     multi_person_tracker.destroy_node()
     rclpy.shutdown()
 
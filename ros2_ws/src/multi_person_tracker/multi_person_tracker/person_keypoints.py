@@ -155,3 +155,35 @@ class person_keypoint:
         if len(kpx) != 0 and len(kpy) != 0:
             self.x = np.nanmean(np.array(kpx))
             self.y = np.nanmean(np.array(kpy))
+
+
+def generatePeople(poses, depth) -> List[person_keypoint]:
+    '''
+    Calculates the location of the person as X and Y coordinates along with the orientation of the person
+    '''
+    persons = []
+    for pose in poses:
+        kpPerson = person_keypoint(pose.Keypoints, depth)
+        if kpPerson.x != None and kpPerson.y != None:
+            persons.append(kpPerson)
+    return persons
+
+
+def mergeDoubleDetections(kpPersons: List[person_keypoint], threshold: float, debug: bool = False) -> List[person_keypoint]:
+    '''
+    Merges detections that are closer than threshold meters, they are the same person detected twice
+    '''
+    if not kpPersons:
+        return kpPersons
+    z = np.array([[complex(p.x, p.y) for p in kpPersons]])
+    popCounter=0
+    distanceMatrix=abs(z.T-z)
+    distanceMatrix = np.where(np.logical_and(0 < distanceMatrix, distanceMatrix < threshold))
+    for i,detection in enumerate(distanceMatrix[0]):
+        kpPersons[detection-popCounter].x = (kpPersons[detection-popCounter].x + kpPersons[distanceMatrix[1][i]-popCounter].x)/2
+        kpPersons[detection-popCounter].y = (kpPersons[detection-popCounter].y + kpPersons[distanceMatrix[1][i]-popCounter].y)/2
+        kpPersons[detection-popCounter].orientation = (kpPersons[detection-popCounter].orientation + kpPersons[distanceMatrix[1][i]-popCounter].orientation)/2
+        kpPersons.pop(distanceMatrix[1][i]-popCounter)
+        popCounter+=1
+        if debug: print("removed double detection")
+    return kpPersons
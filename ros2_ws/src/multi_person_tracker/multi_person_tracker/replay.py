@@ -0,0 +1,310 @@
+import argparse
+import csv
+import os
+import sqlite3
+import time
+from multiprocessing import Pool
+from typing import Dict, List
+
+import numpy as np
+import cv2
+from cv_bridge import CvBridge
+from rosidl_runtime_py.utilities import get_message
+from rclpy.serialization import deserialize_message
+from rclpy.duration import Duration
+from rclpy.time import Time
+import tf2_ros
+
+from .person_keypoints import generatePeople, mergeDoubleDetections
+from .transforms import transformToMatrix, makeDetections
+from .tracking import PeopleTracker
+from .tracing import stampToNs
+from .scheduling import AdaptiveRateScheduler
+
+
+class BagFileParser(object):
+    '''
+    Reads the messages of a rosbag2 sqlite file directly, without a running ROS graph
+
+    Parameters
+    ----------
+    bag_file: path to the .db3 file of the bag
+    '''
+
+    def __init__(self, bag_file):
+        self.conn = sqlite3.connect(bag_file)
+        self.cursor = self.conn.cursor()
+
+        # create a message type map
+        topics_data = self.cursor.execute(
+            "SELECT id, name, type FROM topics").fetchall()
+        self.topic_id = {name_of: id_of for id_of,
+                         name_of, type_of in topics_data}
+        self.topic_name = {id_of: name_of for id_of,
+                           name_of, type_of in topics_data}
+        self.topic_msg_message = {name_of: get_message(
+            type_of) for id_of, name_of, type_of in topics_data}
+
+    def __del__(self):
+        self.conn.close()
+
+    def timeRange(self):
+        '''Returns the first and last bag timestamp in ns'''
+        return self.conn.execute(
+            "SELECT MIN(timestamp), MAX(timestamp) FROM messages").fetchone()
+
+    def messages(self, topics: List[str], start: int = 0, end: int = 2**63 - 1):
+        '''Yields (topic, timestamp, message) of the topics between start and end ordered by timestamp'''
+        ids = [self.topic_id[topic] for topic in topics if topic in self.topic_id]
+        rows = self.conn.execute(
+            "SELECT topic_id, timestamp, data FROM messages WHERE topic_id IN ({}) "
+            "AND timestamp >= ? AND timestamp < ? ORDER BY timestamp".format(','.join('?' * len(ids))),
+            (*ids, start, end))
+        for topic_id, timestamp, data in rows:
+            topic = self.topic_name[topic_id]
+            yield topic, timestamp, deserialize_message(data, self.topic_msg_message[topic])
+
+    def lastBefore(self, topic: str, timestamp: int):
+        '''Returns the last message of topic before timestamp or None'''
+        if topic not in self.topic_id:
+            return None
+        row = self.conn.execute(
+            "SELECT data FROM messages WHERE topic_id = ? AND timestamp < ? ORDER BY timestamp DESC LIMIT 1",
+            (self.topic_id[topic], timestamp)).fetchone()
+        return deserialize_message(row[0], self.topic_msg_message[topic]) if row else None
+
+
+def loadTransforms(parser: BagFileParser) -> tf2_ros.Buffer:
+    '''Fills a tf buffer with all static and dynamic transforms of the bag'''
+    start, end = parser.timeRange()
+    buffer = tf2_ros.Buffer(cache_time=Duration(seconds=(end - start) * 1e-9 + 1.0))
+    for topic, timestamp, msg in parser.messages(['/tf_static', '/tf']):
+        for transform in msg.transforms:
+            if topic == '/tf_static':
+                buffer.set_transform_static(transform, 'replay')
+            else:
+                buffer.set_transform(transform, 'replay')
+    return buffer
+
+
+class ReplayWorker(object):
+    '''
+    Runs pose inference and keypoint projection on time windows of a bag
+
+    Every worker process owns its own network, bag connection and tf buffer.
+
+    Parameters
+    ----------
+    bag_file: path to the .db3 file of the bag
+    cameras: namespaces of the cameras in the bag
+    target_frame: frame the detections are transformed into
+    network: PoseNet model
+    threshold: PoseNet detection threshold
+    mergingThreshold: meters below which two detections are merged
+    '''
+
+    def __init__(self, bag_file: str, cameras: List[str], target_frame: str, network: str = "resnet18-body",
+                 threshold: float = 0.3, mergingThreshold: float = 0.5):
+        import jetson_utils
+        from jetson_inference import poseNet
+        self.cudaFromNumpy = jetson_utils.cudaFromNumpy
+        self.net = poseNet(network, ['replay'], threshold)
+        self.parser = BagFileParser(bag_file)
+        self.tf_buffer = loadTransforms(self.parser)
+        self.bridge = CvBridge()
+        self.cameras = cameras
+        self.target_frame = target_frame
+        self.mergingThreshold = mergingThreshold
+        self.rgbTopics = {'/' + camera + '/color/image_raw': camera for camera in cameras}
+        self.depthTopics = {'/' + camera + '/aligned_depth_to_color/image_raw': camera for camera in cameras}
+
+    def depthImage(self, msg):
+        depth = self.bridge.imgmsg_to_cv2(msg, desired_encoding='passthrough')
+        return np.array(depth, dtype=np.float32)*0.001
+
+    def run(self, window):
+        '''Returns [(stamp, camera, detections)] of all color frames in window and the time spent per stage'''
+        start, end = window
+        timings = {'read': 0.0, 'inference': 0.0, 'postprocess': 0.0, 'frames': 0, 'tf_failures': 0}
+        depth: Dict[str, np.ndarray] = {}
+        for topic, camera in self.depthTopics.items():
+            msg = self.parser.lastBefore(topic, start)
+            if msg is not None:
+                depth[camera] = self.depthImage(msg)
+        results = []
+        t0 = time.perf_counter()
+        for topic, timestamp, msg in self.parser.messages(list(self.rgbTopics) + list(self.depthTopics), start, end):
+            if topic in self.depthTopics:
+                depth[self.depthTopics[topic]] = self.depthImage(msg)
+                continue
+            camera = self.rgbTopics[topic]
+            if camera not in depth:
+                continue
+            rgb = self.bridge.imgmsg_to_cv2(msg, desired_encoding='passthrough')
+            cudaimage = self.cudaFromNumpy(
+                cv2.cvtColor(rgb, cv2.COLOR_BGRA2RGBA).astype(np.float32))
+            t1 = time.perf_counter()
+            poses = self.net.Process(cudaimage, overlay="none")
+            t2 = time.perf_counter()
+            stamp = stampToNs(msg.header.stamp)
+            detections = []
+            if poses:
+                kpPersons = mergeDoubleDetections(
+                    generatePeople(poses, depth[camera]), self.mergingThreshold)
+                try:
+                    transform = self.tf_buffer.lookup_transform(
+                        self.target_frame, camera + "_color_frame", Time(nanoseconds=stamp))
+                    detections = makeDetections(transformToMatrix(transform), kpPersons)
+                except tf2_ros.TransformException:
+                    timings['tf_failures'] += 1
+            results.append((stamp, camera, detections))
+            t3 = time.perf_counter()
+            timings['read'] += t1 - t0
+            timings['inference'] += t2 - t1
+            timings['postprocess'] += t3 - t2
+            timings['frames'] += 1
+            t0 = time.perf_counter()
+        return results, timings
+
+
+worker: ReplayWorker = None
+
+
+def initWorker(*args):
+    global worker
+    worker = ReplayWorker(*args)
+
+
+def processWindow(window):
+    return worker.run(window)
+
+
+def trackDetections(frames, dt: float, newTrack: float = 3, keeptime: float = 5,
+                    scheduler: AdaptiveRateScheduler = None):
+    '''
+    Runs the tracker over the time ordered detections like the node does, predicting every dt
+
+    With a scheduler the frames it would have skipped online are left out.
+    Returns the track stream as rows of (stamp, track_id, x, y, theta, xdot, ydot, thetadot)
+    '''
+    tracker = PeopleTracker(newTrack=newTrack, keeptime=keeptime, dt=dt)
+    rows = []
+    if not frames:
+        return rows
+    step = int(dt * 1e9)
+    tick = frames[0][0]
+
+    def publishAndPredict(tick):
+        for p in tracker.tracklets:
+            rows.append((tick, p.trackId, float(p.personX), float(p.personY), float(p.personTheta),
+                         float(p.personXdot), float(p.personYdot), float(p.personThetadot)))
+        tracker.predict(tick)
+        if scheduler:
+            scheduler.update(tracker.tracklets, tracker.nextTrackId, tick)
+
+    for stamp, camera, detections in frames:
+        while tick <= stamp:
+            publishAndPredict(tick)
+            tick += step
+        if scheduler and not scheduler.admit(camera, stamp):
+            continue
+        if detections:
+            tracker.update(detections, stamp)
+    publishAndPredict(tick)
+    return rows
+
+
+def trackDeviation(reference, rows) -> float:
+    '''Mean distance in meters from every track of rows to the closest reference track of the same stamp'''
+    positions: Dict[int, list] = {}
+    for row in reference:
+        positions.setdefault(row[0], []).append(row[2:4])
+    distances = [np.min(np.hypot(*(np.array(positions[row[0]]) - row[2:4]).T))
+                 for row in rows if row[0] in positions]
+    return float(np.mean(distances)) if distances else float('nan')
+
+
+def replay(bag_file: str, cameras: List[str], target_frame: str, output: str, dt: float = 0.02,
+           n_workers: int = os.cpu_count(), windowLength: float = 10.0, network: str = "resnet18-body",
+           threshold: float = 0.3, adaptiveRate: bool = False, minRate: float = 10.0, maxRate: float = 30.0):
+    '''
+    Processes a bag as fast as possible and writes the track stream of the tracker to output as csv
+
+    The bag is split into windows of windowLength seconds which are run through pose inference
+    and keypoint projection on n_workers processes, the tracker then runs over the merged
+    detections in time order.
+    With adaptiveRate the tracker only receives the frames the adaptive scheduler admits and
+    the skipped share of inference is reported together with the deviation from the tracks
+    of all frames.
+    '''
+    wallStart = time.perf_counter()
+    start, end = BagFileParser(bag_file).timeRange()
+    step = int(windowLength * 1e9)
+    windows = [(t, min(t + step, end + 1)) for t in range(start, end + 1, step)]
+
+    frames = []
+    timings = {'read': 0.0, 'inference': 0.0, 'postprocess': 0.0, 'frames': 0, 'tf_failures': 0}
+    with Pool(n_workers, initializer=initWorker,
+              initargs=(bag_file, cameras, target_frame, network, threshold)) as pool:
+        for results, windowTimings in pool.imap(processWindow, windows):
+            frames += results
+            for key, value in windowTimings.items():
+                timings[key] += value
+    frames.sort(key=lambda frame: frame[0])
+
+    trackStart = time.perf_counter()
+    rows = trackDetections(frames, dt)
+    trackTime = time.perf_counter() - trackStart
+    if adaptiveRate:
+        scheduler = AdaptiveRateScheduler(minRate, maxRate)
+        allFrameRows = rows
+        rows = trackDetections(frames, dt, scheduler=scheduler)
+
+    with open(output, mode='w') as csvfile:
+        writer = csv.writer(csvfile, delimiter=',')
+        writer.writerow(['stamp', 'track_id', 'x', 'y', 'theta', 'xdot', 'ydot', 'thetadot'])
+        writer.writerows(rows)
+
+    wall = time.perf_counter() - wallStart
+    duration = (end - start) * 1e-9
+    frameCount = max(timings['frames'], 1)
+    print(f"Replayed {duration:.1f}s of {bag_file} in {wall:.1f}s ({duration / wall:.1f}x realtime) "
+          f"with {n_workers} workers")
+    print(f"  frames: {timings['frames']} ({timings['frames'] / wall:.1f} fps), tf failures: {timings['tf_failures']}")
+    print(f"  per frame: read {1e3 * timings['read'] / frameCount:.1f}ms, "
+          f"inference {1e3 * timings['inference'] / frameCount:.1f}ms, "
+          f"postprocess {1e3 * timings['postprocess'] / frameCount:.1f}ms")
+    print(f"  tracker: {trackTime:.2f}s for {len(rows)} track rows written to {output}")
+    if adaptiveRate:
+        saved = scheduler.computeSaved()
+        print(f"  adaptive rate {minRate:.1f}-{maxRate:.1f}Hz: {100 * saved:.1f}% of frames skipped "
+              f"(~{saved * timings['inference']:.1f}s inference saved), "
+              f"mean deviation from all frame tracks {trackDeviation(allFrameRows, rows):.3f}m")
+        for camera, received, skipped in scheduler.metrics():
+            print(f"    {camera}: {skipped} of {received} frames skipped")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Replay a rosbag2 through the pose estimation and tracker without ROS')
+    parser.add_argument('bag', help='.db3 file of the bag')
+    parser.add_argument('--output', default='tracks.csv')
+    parser.add_argument('--cameras', nargs='+', default=['camera1', 'camera2'])
+    parser.add_argument('--target-frame', default='camera_link')
+    parser.add_argument('--dt', type=float, default=0.02)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--window', type=float, default=10.0, help='seconds of bag per work item')
+    parser.add_argument('--network', default='resnet18-body')
+    parser.add_argument('--threshold', type=float, default=0.3)
+    parser.add_argument('--adaptive', action='store_true',
+                        help='track only the frames the adaptive scheduler admits and report the compute saved')
+    parser.add_argument('--min-rate', type=float, default=10.0)
+    parser.add_argument('--max-rate', type=float, default=30.0)
+    args = parser.parse_args(args)
+    replay(args.bag, args.cameras, args.target_frame, args.output, args.dt,
+           args.workers, args.window, args.network, args.threshold,
+           args.adaptive, args.min_rate, args.max_rate)
+
+
+if __name__ == '__main__':
+    main()
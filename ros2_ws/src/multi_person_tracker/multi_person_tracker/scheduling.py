@@ -0,0 +1,262 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, List
+
+import numpy as np
+
+from .frame_aggregator import Frame
+
+
+class FrameSlot(object):
+    '''
+    Bounded queue of frames of one camera, the oldest frame is dropped when it is full
+
+    The slot is busy from taking a frame until that frame updated the tracker, so the frames
+    of one camera reach the tracker in the order of their stamps also with several workers.
+
+    Parameters
+    ----------
+    depth: maximum number of frames waiting for inference
+    '''
+
+    def __init__(self, depth: int = 1):
+        self.frames = deque(maxlen=depth)
+        self.busy = False
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.frames) and not self.busy
+
+    def put(self, frame: Frame):
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append(frame)
+        self.received += 1
+
+    def take(self) -> Frame:
+        # latest frame wins, everything older is stale by now
+        frame = self.frames.pop()
+        self.dropped += len(self.frames)
+        self.frames.clear()
+        self.processed += 1
+        self.busy = True
+        return frame
+
+    def oldestArrival(self) -> float:
+        return self.frames[0].arrival
+
+
+class LatestSlot(object):
+    '''
+    Hands the latest item of one pipeline stage to the next stage, an item that was not taken is overwritten
+    '''
+
+    def __init__(self):
+        self.item = None
+        self.condition = threading.Condition()
+        self.closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, item):
+        with self.condition:
+            if self.item is not None:
+                self.dropped += 1
+            self.item = item
+            self.received += 1
+            self.condition.notify()
+
+    def take(self):
+        '''Blocks until an item is available and returns it, returns None once the slot is closed'''
+        with self.condition:
+            while self.item is None and not self.closed:
+                self.condition.wait()
+            item, self.item = self.item, None
+            return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class InferenceWorkerPool(object):
+    '''
+    Runs pose inference and post processing of camera frames outside of the ROS executor
+
+    Image callbacks only put frames into the slot of their camera, the worker threads take
+    the latest frame of each slot and run the network, the keypoint projection and the
+    tracker update. A camera is only served by one worker at a time, so its detections
+    never reach the tracker out of order. When an aggregator is given the workers wait up to its latency budget
+    for a frame of every camera and run them as one batch.
+
+    Parameters
+    ----------
+    aggregator: FrameAggregator used for batched inference or None for one frame at a time
+    n_workers: number of worker threads
+    slotDepth: number of frames each camera slot holds before the oldest is dropped
+    latencyBudget: seconds a batch waits for the frames of the other cameras
+    '''
+
+    def __init__(self, aggregator=None, n_workers: int = 1, slotDepth: int = 1, latencyBudget: float = 0.02):
+        self.aggregator = aggregator
+        self.slotDepth = slotDepth
+        self.latencyBudget = latencyBudget
+        self.slots: Dict[object, FrameSlot] = {}
+        self.condition = threading.Condition()
+        self.running = True
+        self.workers = [threading.Thread(target=self.work, daemon=True, name=f"inference_worker_{i}")
+                        for i in range(n_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def addCamera(self, camera):
+        with self.condition:
+            self.slots[camera] = FrameSlot(self.slotDepth)
+
+    def put(self, camera, frame: Frame):
+        with self.condition:
+            self.slots[camera].put(frame)
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for worker in self.workers:
+            worker.join()
+
+    def metrics(self):
+        '''Returns (camera, queue depth, received, dropped, processed) for every camera slot'''
+        with self.condition:
+            return [(camera, len(slot), slot.received, slot.dropped, slot.processed)
+                    for camera, slot in self.slots.items()]
+
+    def takeFrames(self) -> List[Frame]:
+        '''Takes the frames of the next inference and marks their slots busy until release()'''
+        with self.condition:
+            while self.running and not any(slot.ready for slot in self.slots.values()):
+                self.condition.wait()
+            if self.aggregator:
+                # give the idle cameras until the latency budget of the oldest frame to deliver
+                while self.running and any(not len(slot) and not slot.busy for slot in self.slots.values()):
+                    waiting = [slot.oldestArrival() for slot in self.slots.values() if slot.ready]
+                    if not waiting:
+                        break
+                    remaining = min(waiting) + self.latencyBudget - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                return [slot.take() for slot in self.slots.values() if slot.ready]
+            # serve the camera whose frame waited longest
+            slot = min((slot for slot in self.slots.values() if slot.ready),
+                       key=FrameSlot.oldestArrival, default=None)
+            return [slot.take()] if slot else []
+
+    def release(self, frames: List[Frame]):
+        '''Frees the slots of frames once they updated the tracker'''
+        with self.condition:
+            for frame in frames:
+                self.slots[frame.camera].busy = False
+            self.condition.notify_all()
+
+    def work(self):
+        while self.running:
+            frames = self.takeFrames()
+            if not frames:
+                continue
+            try:
+                if self.aggregator:
+                    self.aggregator.process(frames)
+                else:
+                    frames[0].camera.inferFrame(frames[0])
+            except Exception as e:
+                print(f"Exception in inference worker")
+                print(e)
+            finally:
+                self.release(frames)
+
+
+class AdaptiveRateScheduler(object):
+    '''
+    Lowers the inference rate of the cameras while all tracks are certain
+
+    The uncertainty of a tracklet is its position standard deviation plus the distance it
+    may have moved since its last detection (speed * age). The inference rate is maxRate
+    while the most uncertain tracklet is above highUncertainty, minRate below lowUncertainty
+    and interpolated in between. A new tracklet, i.e. a person entering the field of view,
+    raises the rate to maxRate for boostTime seconds.
+
+    Parameters
+    ----------
+    minRate: lowest inference rate per camera [Hz]
+    maxRate: highest inference rate per camera [Hz]
+    lowUncertainty: uncertainty [m] below which minRate is used
+    highUncertainty: uncertainty [m] above which maxRate is used
+    boostTime: seconds maxRate is kept after a new tracklet appeared
+    '''
+
+    def __init__(self, minRate: float = 10.0, maxRate: float = 30.0, lowUncertainty: float = 0.05,
+                 highUncertainty: float = 0.3, boostTime: float = 1.0):
+        self.minRate = minRate
+        self.maxRate = maxRate
+        self.lowUncertainty = lowUncertainty
+        self.highUncertainty = highUncertainty
+        self.boostTime = boostTime
+        self.rate = maxRate
+        self.lastTrackId = 0
+        self.boostUntil = 0
+        self.lastRun: Dict[object, int] = {}
+        self.received: Dict[object, int] = {}
+        self.skipped: Dict[object, int] = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def uncertainty(tracklet, timestamp: int) -> float:
+        speed = np.hypot(float(tracklet.personXdot), float(tracklet.personYdot))
+        age = max(timestamp - tracklet.measTimestamp, 0)*1e-9
+        return float(np.sqrt(tracklet.P[0, 0] + tracklet.P[1, 1])) + speed*age
+
+    def update(self, tracklets, nextTrackId: int, timestamp: int):
+        '''Recomputes the inference rate from the current tracklets'''
+        if nextTrackId > self.lastTrackId:
+            self.lastTrackId = nextTrackId
+            self.boostUntil = timestamp + int(self.boostTime*1e9)
+        if timestamp < self.boostUntil:
+            self.rate = self.maxRate
+            return
+        uncertainty = max((self.uncertainty(t, timestamp) for t in tracklets), default=0.0)
+        fraction = np.clip((uncertainty - self.lowUncertainty) /
+                           (self.highUncertainty - self.lowUncertainty), 0.0, 1.0)
+        self.rate = self.minRate + fraction*(self.maxRate - self.minRate)
+
+    def admit(self, camera, timestamp: int) -> bool:
+        '''Returns True if the frame of camera arriving at timestamp should be run through inference'''
+        with self.lock:
+            self.received[camera] = self.received.get(camera, 0) + 1
+            last = self.lastRun.get(camera)
+            # admit slightly early so camera jitter does not skip every other frame at maxRate
+            if last is None or (timestamp - last)*1e-9 >= 0.9/self.rate:
+                self.lastRun[camera] = timestamp
+                return True
+            self.skipped[camera] = self.skipped.get(camera, 0) + 1
+            return False
+
+    def metrics(self):
+        '''Returns (camera, received, skipped) for every camera'''
+        with self.lock:
+            return [(camera, received, self.skipped.get(camera, 0))
+                    for camera, received in self.received.items()]
+
+    def computeSaved(self) -> float:
+        '''Fraction of the received frames that were not run through inference'''
+        with self.lock:
+            received = sum(self.received.values())
+            return sum(self.skipped.values())/received if received else 0.0
@@ -0,0 +1,212 @@
+import argparse
+import bisect
+import json
+import tempfile
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List
+
+import numpy as np
+
+# log spaced latency histogram bucket edges from 0.1ms to ~10s in ns
+BUCKET_EDGES = [int(1e5 * 1.2**i) for i in range(64)]
+
+
+def stampToNs(stamp) -> int:
+    '''Converts a builtin_interfaces Time message to ns'''
+    return stamp.sec * 1000000000 + stamp.nanosec
+
+
+class LatencyHistogram(object):
+    '''Fixed bucket histogram of latencies in ns'''
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_EDGES) + 1)
+        self.total = 0
+        self.maximum = 0
+
+    def add(self, latency: int):
+        self.counts[bisect.bisect_right(BUCKET_EDGES, latency)] += 1
+        self.total += 1
+        self.maximum = max(self.maximum, latency)
+
+    def percentile(self, q: float) -> float:
+        '''Upper bucket edge in ms below which q percent of the latencies are'''
+        if not self.total:
+            return float('nan')
+        index = int(np.searchsorted(np.cumsum(self.counts), q / 100 * self.total))
+        if index >= len(BUCKET_EDGES):
+            return self.maximum * 1e-6
+        return min(BUCKET_EDGES[index], self.maximum) * 1e-6
+
+
+class Tracer(object):
+    '''
+    Records when data originating from a stamp passes the stages of the perception pipeline
+
+    Every mark adds the latency between the originating stamp and now to the histogram of
+    the stage. Optionally the marks are kept as Chrome trace events (chrome://tracing or
+    Perfetto) and written to tracePath when the tracer is dumped, so the trace files of
+    the tracker, the social map generator and the interaction detector can be merged
+    and followed from the camera image to the interaction boxes.
+
+    Parameters
+    ----------
+    name: name of the process shown in the trace
+    clock: function returning the current time in ns on the same clock as the stamps
+    enabled: when False all calls return immediately
+    tracePath: json file the Chrome trace is written to, None to only keep histograms
+    maxEvents: number of trace events kept in memory
+    '''
+
+    def __init__(self, name: str, clock: Callable[[], int] = time.time_ns, enabled: bool = True,
+                 tracePath: str = None, maxEvents: int = 100000):
+        self.name = name
+        self.clock = clock
+        self.enabled = enabled
+        self.tracePath = tracePath
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.events = deque(maxlen=maxEvents) if tracePath else None
+        self.lock = threading.Lock()
+        self.wallStart = time.perf_counter()
+        self.cpuStart = time.process_time()
+
+    @classmethod
+    def fromEnvironment(cls, name: str, clock: Callable[[], int] = time.time_ns):
+        '''
+        Creates a tracer configured by PERCEPTION_TRACING=1 and PERCEPTION_TRACE_DIR=<directory for Chrome traces>
+        '''
+        enabled = os.environ.get('PERCEPTION_TRACING', '0') not in ('0', '', 'false', 'False')
+        traceDir = os.environ.get('PERCEPTION_TRACE_DIR')
+        tracePath = os.path.join(traceDir, f"{name}_trace.json") if traceDir else None
+        return cls(name, clock, enabled, tracePath)
+
+    def mark(self, stage: str, stamp: int, **args):
+        '''
+        Records that data with the originating stamp in ns reached stage now, args are stored in the trace event
+
+        Stages that publish data under a new stamp pass it as key=<new stamp in ns>, so later
+        stages keyed by that stamp can be traced back to the originating stamp.
+        '''
+        if not self.enabled:
+            return
+        now = self.clock()
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram()
+            histogram.add(now - stamp)
+            if self.events is not None:
+                self.events.append((stage, stamp, now, args))
+
+    def summary(self) -> List[tuple]:
+        '''Returns (stage, count, p50, p90, p99, max) with latencies in ms'''
+        with self.lock:
+            return [(stage, h.total, h.percentile(50), h.percentile(90), h.percentile(99), h.maximum * 1e-6)
+                    for stage, h in self.histograms.items()]
+
+    def cpuUsage(self):
+        '''Returns the cpu seconds of the whole process and the wall seconds since the tracer was created'''
+        return time.process_time() - self.cpuStart, time.perf_counter() - self.wallStart
+
+    def report(self, withCpu: bool = True) -> str:
+        lines = [f"{self.name} latency [ms] from originating stamp"]
+        for stage, count, p50, p90, p99, maximum in self.summary():
+            lines.append(f"  {stage}: n={count} p50={p50:.1f} p90={p90:.1f} p99={p99:.1f} max={maximum:.1f}")
+        if withCpu:
+            cpu, wall = self.cpuUsage()
+            lines.append(f"  process cpu: {cpu:.1f}s in {wall:.1f}s ({100 * cpu / wall:.0f}% of one core)")
+        return '\n'.join(lines)
+
+    def traceEvents(self) -> List[dict]:
+        with self.lock:
+            events = list(self.events or [])
+        return [{"name": stage, "cat": self.name, "ph": "X", "pid": self.name, "tid": stage,
+                 "ts": stamp / 1e3, "dur": (now - stamp) / 1e3, "args": dict(args, stamp=stamp)}
+                for stage, stamp, now, args in events]
+
+    def dump(self):
+        '''Writes the Chrome trace to tracePath'''
+        if not self.enabled or not self.tracePath:
+            return
+        with open(self.tracePath, 'w') as f:
+            json.dump({"traceEvents": self.traceEvents()}, f)
+
+
+def mergeTraces(output: str, inputs: List[str]):
+    '''
+    Merges the Chrome traces of several processes and reports end to end latencies
+
+    Trace events carrying a key argument map the stamp they published with to their originating
+    camera stamp, events of later stages keyed by that stamp are measured from the camera stamp.
+    '''
+    events = []
+    for path in inputs:
+        with open(path) as f:
+            events += json.load(f)["traceEvents"]
+    origins = {event["args"]["key"]: event["args"]["stamp"]
+               for event in events if "key" in event["args"]}
+    endToEnd: Dict[str, list] = {}
+    for event in events:
+        origin = origins.get(event["args"]["stamp"])
+        if origin is not None:
+            end = event["ts"] * 1e3 + event["dur"] * 1e3
+            endToEnd.setdefault(f'{event["cat"]}/{event["name"]}', []).append((end - origin) * 1e-6)
+    with open(output, 'w') as f:
+        json.dump({"traceEvents": events}, f)
+    for stage, latencies in endToEnd.items():
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        print(f"{stage}: n={len(latencies)} from camera p50={p50:.1f}ms p90={p90:.1f}ms p99={p99:.1f}ms")
+
+
+def measureOverhead(marks: int = 100000, marksPerFrame: int = 5, rate: float = 30.0, verbose: bool = True) -> dict:
+    '''
+    Times Tracer.mark disabled, enabled with histograms only and enabled with trace events, the
+    tracker marks inference and tracker_update per camera and the publish of the people per frame
+
+    Return
+    ----------
+    results: ns per mark and share of a frame at rate [Hz] taken by marksPerFrame marks [%] per configuration
+    '''
+    results = {}
+    with tempfile.TemporaryDirectory() as traceDir:
+        configurations = {'disabled': Tracer('overhead', enabled=False),
+                          'histograms': Tracer('overhead'),
+                          'trace events': Tracer('overhead', tracePath=os.path.join(traceDir, 'trace.json'))}
+        for name, tracer in configurations.items():
+            stamp = time.time_ns()
+            start = time.perf_counter_ns()
+            for i in range(marks):
+                tracer.mark('inference', stamp, camera='camera1')
+            perMark = (time.perf_counter_ns() - start)/marks
+            results[name] = {'perMark': perMark, 'frameShare': 100*perMark*marksPerFrame*rate*1e-9}
+    if verbose:
+        for name, result in results.items():
+            print(f"{name:>12}: {result['perMark']/1e3:6.2f}us per mark, {marksPerFrame} marks "
+                  f"{result['frameShare']:.4f}% of a frame at {rate:g}Hz")
+    return results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Latency tracing of the perception pipeline')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    merge = subparsers.add_parser('merge', help='merge the Chrome traces of several processes')
+    merge.add_argument('output')
+    merge.add_argument('inputs', nargs='+')
+    overhead = subparsers.add_parser('overhead', help='time of a mark with tracing disabled and enabled')
+    overhead.add_argument('--marks', type=int, default=100000)
+    overhead.add_argument('--marks-per-frame', type=int, default=5)
+    overhead.add_argument('--rate', type=float, default=30.0)
+    args = parser.parse_args(args)
+    if args.command == 'merge':
+        mergeTraces(args.output, args.inputs)
+    else:
+        measureOverhead(args.marks, args.marks_per_frame, args.rate)
+
+
+if __name__ == '__main__':
+    # python3 -m multi_person_tracker.tracing merge merged.json tracker_trace.json social_map_trace.json ...
+    # python3 -m multi_person_tracker.tracing overhead
+    main()
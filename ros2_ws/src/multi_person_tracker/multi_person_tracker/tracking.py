@@ -31,6 +31,7 @@ class KalmanFilter(object):
     y_std_meas: standard deviation of the measurement in y-direction
     theta_std_meas: standard deviation of the measurement in orientation (theta)
     decay: amount of decay applied to velocities at each prediction
+    trackId: unique ID of the tracklet
     """
 
     def __init__(
@@ -51,9 +52,11 @@ class KalmanFilter(object):
             theta_std_meas=0.000001,
             decay=0.90,
             keypoints=[],
+            trackId=0,
             debug=False):
 
         self.debug = debug
+        self.trackId = trackId
 
         # Define variables for sotring current position
         self.personX = x
@@ -217,6 +220,11 @@ class PeopleTracker(object):
         self.dt = dt
         self.debug = debug
         self.tracklets = []
+        self.nextTrackId = 0
+
+    def newTrackId(self):
+        self.nextTrackId += 1
+        return self.nextTrackId
 
     def predict(self,timestamp):
         popCounter=0
@@ -262,7 +270,8 @@ class PeopleTracker(object):
                             withTheta=detections[i - popCounter].withTheta,
                             timestamp=timestamp,
                             dt=self.dt,
-                            keypoints=detections[i - popCounter].keypoints))
+                            keypoints=detections[i - popCounter].keypoints,
+                            trackId=self.newTrackId()))
                     detections.pop(i - popCounter)
                     distMat = np.delete(distMat, i-popCounter, 0)
                     popCounter += 1
@@ -309,6 +318,7 @@ class PeopleTracker(object):
                     withTheta=detection.withTheta,
                     timestamp=timestamp,
                     dt=self.dt,
-                    keypoints=detection.keypoints))
+                    keypoints=detection.keypoints,
+                    trackId=self.newTrackId()))
 
         return updates
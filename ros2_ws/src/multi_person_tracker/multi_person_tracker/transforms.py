@@ -0,0 +1,130 @@
+import numpy as np
+import rclpy
+from tf_transformations import quaternion_matrix
+
+from .tracking import Detection
+
+
+def transformToMatrix(transform) -> np.ndarray:
+    '''
+    Converts a geometry_msgs TransformStamped into a homogeneous 4x4 matrix
+    '''
+    rotation = transform.transform.rotation
+    translation = transform.transform.translation
+    matrix = quaternion_matrix(
+        [rotation.x, rotation.y, rotation.z, rotation.w])
+    matrix[:3, 3] = [translation.x, translation.y, translation.z]
+    return matrix
+
+
+class CachedTransform(object):
+    '''
+    Transform from a camera frame into the target frame kept as a 4x4 matrix
+
+    With maxAge 0 the transform is looked up at the stamp of every image, waiting up to timeout
+    for it, so the people are placed where the camera was when the image was taken in target
+    frames the robot moves in, like map or odom.
+    With a positive maxAge the target frame has to be fixed to the robot like camera_link, the
+    latest transform is then only looked up again once it is older than maxAge instead of for
+    every frame and if the refresh fails the last valid matrix keeps being used.
+
+    Parameters
+    ----------
+    tf_buffer: tf2_ros Buffer filled by a TransformListener
+    target_frame: frame the detections are transformed into
+    source_frame: frame of the camera
+    maxAge: seconds after which the cached transform is refreshed, 0 to look it up for every image
+    timeout: seconds a lookup at the stamp of an image waits for the transform
+    '''
+
+    def __init__(self, tf_buffer, target_frame: str, source_frame: str, maxAge: float = 0.0,
+                 timeout: float = 0.05):
+        self.tf_buffer = tf_buffer
+        self.target_frame = target_frame
+        self.source_frame = source_frame
+        self.maxAge = maxAge
+        self.timeout = timeout
+        self.matrix: np.ndarray = None
+        self.stamp: int = None  # ns at which the matrix was looked up
+
+    def valid(self, stamp: int) -> bool:
+        return self.maxAge > 0 and self.matrix is not None and (stamp - self.stamp)*1e-9 <= self.maxAge
+
+    def get(self, stamp: int) -> np.ndarray:
+        '''
+        Returns the matrix at the image stamp [ns], or the cached one refreshed with the latest
+        transform when it expired
+        '''
+        if self.valid(stamp):
+            return self.matrix
+        if self.maxAge <= 0:
+            transform = self.tf_buffer.lookup_transform(
+                self.target_frame, self.source_frame, rclpy.time.Time(nanoseconds=stamp),
+                timeout=rclpy.time.Duration(seconds=self.timeout))
+            return transformToMatrix(transform)
+        try:
+            transform = self.tf_buffer.lookup_transform(
+                self.target_frame, self.source_frame, rclpy.time.Time())
+            self.matrix = transformToMatrix(transform)
+            self.stamp = stamp
+        except Exception:
+            if self.matrix is None:
+                raise
+        return self.matrix
+
+
+def transformDetections(matrix: np.ndarray, positions: np.ndarray, orientations: np.ndarray, keypoints: np.ndarray):
+    '''
+    Transforms the positions, orientations and keypoints of all people of a frame with one matrix multiply
+
+    Parameters
+    ----------
+    matrix: 4x4 transform into the target frame
+    positions: (N, 2) x,y of the people on the ground plane
+    orientations: (N,) yaw of the people
+    keypoints: (K, 3) 3D keypoints of all people
+    Return
+    ----------
+    positions: (N, 2) x,y in the target frame
+    orientations: (N,) yaw in the target frame in the range (0, 2pi]
+    keypoints: (K, 3) keypoints in the target frame
+    '''
+    n = len(positions)
+    points = np.zeros((2*n + len(keypoints), 4))
+    points[:n, :2] = positions
+    points[:n, 3] = 1.0
+    # heading as direction vector, so only the rotation is applied to it
+    points[n:2*n, 0] = np.cos(orientations)
+    points[n:2*n, 1] = np.sin(orientations)
+    points[2*n:, :3] = keypoints
+    points[2*n:, 3] = 1.0
+    points = points @ matrix.T
+
+    angles = np.arctan2(points[n:2*n, 1], points[n:2*n, 0])
+    angles = np.where(angles > 0, angles, angles + 2*np.pi)
+    return points[:n, :2], angles, points[2*n:, :3]
+
+
+def makeDetections(matrix: np.ndarray, kpPersons, withKeypoints: bool = False):
+    '''
+    Transforms the people of one frame into the target frame and returns them as tracker detections
+
+    Parameters
+    ----------
+    matrix: 4x4 transform from the camera into the target frame
+    kpPersons: person_keypoint objects of the frame
+    withKeypoints: also transform the 3D keypoints of the people
+    '''
+    positions = np.array([[person.x, person.y] for person in kpPersons], dtype=float).reshape(-1, 2)
+    orientations = np.array([person.orientation for person in kpPersons], dtype=float)
+    keypoints = [[] for person in kpPersons]
+    if withKeypoints:
+        keypoints = [np.array([[kp.x, kp.y, kp.z] for kp in person.keypoints if kp.x and kp.y and kp.z],
+                              dtype=float).reshape(-1, 3) for person in kpPersons]
+    counts = [len(kps) for kps in keypoints]
+    allKeypoints = np.concatenate(keypoints) if sum(counts) else np.zeros((0, 3))
+    positions, angles, allKeypoints = transformDetections(
+        matrix, positions, orientations, allKeypoints)
+    keypoints = np.split(allKeypoints, np.cumsum(counts)[:-1])
+    return [Detection(positions[i, 0], positions[i, 1], angles[i], person.withTheta, keypoints[i])
+            for i, person in enumerate(kpPersons)]
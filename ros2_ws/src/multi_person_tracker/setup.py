@@ -21,6 +21,7 @@ setup(
     entry_points={
         'console_scripts': [
                 'multi_person_tracker = multi_person_tracker.multi_person_tracker:main',
+                'multi_person_tracker_replay = multi_person_tracker.replay:main',
         ],
 },
 )
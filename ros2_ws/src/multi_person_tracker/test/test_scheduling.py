@@ -0,0 +1,45 @@
+import random
+import threading
+import time
+
+from multi_person_tracker.frame_aggregator import Frame
+from multi_person_tracker.scheduling import InferenceWorkerPool
+
+
+class FakeCamera(object):
+    '''Records the stamps its frames update the tracker with and whether two workers ever overlapped'''
+
+    def __init__(self):
+        self.stamps = []
+        self.running = 0
+        self.overlapped = False
+        self.lock = threading.Lock()
+
+    def inferFrame(self, frame):
+        with self.lock:
+            self.running += 1
+            self.overlapped |= self.running > 1
+        # inference times vary, a later frame could otherwise overtake an earlier one
+        time.sleep(random.uniform(0, 0.004))
+        with self.lock:
+            self.stamps.append(frame.stamp)
+            self.running -= 1
+
+
+def test_frames_of_a_camera_update_the_tracker_in_order():
+    random.seed(0)
+    pool = InferenceWorkerPool(n_workers=4, slotDepth=2)
+    cameras = [FakeCamera(), FakeCamera()]
+    for camera in cameras:
+        pool.addCamera(camera)
+    for stamp in range(300):
+        for camera in cameras:
+            pool.put(camera, Frame(camera, None, None, stamp, stamp))
+        time.sleep(0.0005)
+    time.sleep(0.05)
+    pool.stop()
+
+    for camera in cameras:
+        assert len(camera.stamps) > 10
+        assert not camera.overlapped
+        assert camera.stamps == sorted(camera.stamps)
@@ -0,0 +1,9 @@
+from multi_person_tracker.tracing import measureOverhead
+
+
+def test_marks_take_under_one_percent_of_a_frame():
+    results = measureOverhead(marks=20000, verbose=False)
+    # generous bound, a mark costs a few us against the 33ms of a frame at 30Hz
+    for name, result in results.items():
+        assert result['frameShare'] < 1.0, (name, result)
+    assert results['disabled']['perMark'] < results['histograms']['perMark']
@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip('rclpy')
+tf = pytest.importorskip('tf_transformations')
+
+from multi_person_tracker.transforms import CachedTransform, transformDetections  # noqa: E402
+
+
+def quaternionPath(matrix, positions, orientations):
+    '''The per person do_transform_pose and euler_from_quaternion the tracker used before'''
+    rotation = tf.quaternion_from_matrix(matrix)
+    results = []
+    for (x, y), orientation in zip(positions, orientations):
+        position = matrix @ [x, y, 0.0, 1.0]
+        quad = tf.quaternion_multiply(rotation, tf.quaternion_about_axis(orientation, (0, 0, 1)))
+        angle = tf.euler_from_quaternion(quad)[2]
+        angle = angle if angle > 0 else angle + 2*np.pi
+        results.append((position[0], position[1], angle))
+    return np.array(results)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_quaternion_path(seed):
+    rng = np.random.default_rng(seed)
+    # mostly yaw with a bit of camera pitch and roll
+    roll, pitch = rng.uniform(-0.3, 0.3, 2)
+    matrix = tf.euler_matrix(roll, pitch, rng.uniform(-np.pi, np.pi))
+    matrix[:3, 3] = rng.uniform(-5, 5, 3)
+    positions = rng.uniform(-4, 4, (8, 2))
+    orientations = rng.uniform(0, 2*np.pi, 8)
+    keypoints = rng.uniform(-4, 4, (5, 3))
+
+    xy, angles, transformed = transformDetections(matrix, positions, orientations, keypoints)
+    expected = quaternionPath(matrix, positions, orientations)
+    assert np.allclose(xy, expected[:, :2])
+    # the same heading, also across the 0/2pi wrap
+    assert np.allclose(np.exp(1j*angles), np.exp(1j*expected[:, 2]))
+    assert np.all((angles > 0) & (angles <= 2*np.pi))
+    assert np.allclose(transformed, keypoints @ matrix[:3, :3].T + matrix[:3, 3])
+
+
+class FakeBuffer(object):
+    def __init__(self):
+        self.lookups = []
+
+    def lookup_transform(self, target_frame, source_frame, time, timeout=None):
+        self.lookups.append(time.nanoseconds)
+        return SimpleNamespace(transform=SimpleNamespace(
+            rotation=SimpleNamespace(x=0.0, y=0.0, z=0.0, w=1.0),
+            translation=SimpleNamespace(x=1e-9*len(self.lookups), y=0.0, z=0.0)))
+
+
+def test_looks_up_at_the_image_stamp():
+    buffer = FakeBuffer()
+    transform = CachedTransform(buffer, 'map', 'camera')
+    transform.get(100)
+    transform.get(200)
+    assert buffer.lookups == [100, 200]
+
+
+def test_caches_the_latest_transform_of_static_frames():
+    buffer = FakeBuffer()
+    transform = CachedTransform(buffer, 'camera_link', 'camera', maxAge=1.0)
+    first = transform.get(0)
+    assert transform.get(int(0.5e9)) is first
+    transform.get(int(1.5e9))
+    # latest transform, time 0
+    assert buffer.lookups == [0, 0]